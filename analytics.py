@@ -0,0 +1,268 @@
+# per player statistics over the hand histories games write (see poker/history.py).
+#
+#   python analytics.py                                  # every file in HISTORY_DIR
+#   python analytics.py --checkpoint stats.npz           # only reads what's new since the last run
+#   python analytics.py some/dir --workers 8 --top 50 --json stats.json
+#
+# each file is memory-mapped and streamed through generators (records, then
+# hands, then counter updates), so memory stays flat however big the files are.
+# counts are kept in one int64 NumPy array per run, a row per player. files are
+# independent, so they can be split across a process pool. the checkpoint keeps
+# the counters and how far into each file they got: since the files are append
+# only, a re-run starts each file where the last one stopped.
+import argparse
+import json
+import mmap
+import os
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from poker.engine import CALL, RAISE, PREFLOP
+from poker.history import HISTORY_DIR, FILE_HEADER, GAME, HAND, BLIND, ACTION, RESULT, check_header, iter_entries
+
+# same values as PlayerTypes in poker.game
+DEALER, BIG_BLIND, SMALL_BLIND, NORMAL = range(4)
+POSITION_NAMES = ["dealer", "big_blind", "small_blind", "other"]
+
+# counter columns
+HANDS, VPIP, PFR, BETS, CALLS, SHOWDOWNS, SHOWDOWN_WINS = range(7)
+# then hands and net chips for each position
+POSITION_HANDS = 7
+POSITION_NET = POSITION_HANDS + len(POSITION_NAMES)
+NUM_COUNTERS = POSITION_NET + len(POSITION_NAMES)
+
+# counter updates buffered before they are added into the array
+FLUSH_EVERY = 1 << 20
+
+
+class Counters:
+    def __init__(self):
+        self.rows = {}
+        self.user_ids = array("Q")
+        self.counts = np.zeros((0, NUM_COUNTERS), dtype=np.int64)
+
+    def row(self, user_id):
+        row = self.rows.get(user_id)
+        if row is None:
+            row = self.rows[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+        return row
+
+    # makes room for every player given a row so far
+    def _fit(self):
+        if len(self.user_ids) > len(self.counts):
+            grown = np.zeros((max(len(self.user_ids), 2 * len(self.counts)), NUM_COUNTERS), dtype=np.int64)
+            grown[:len(self.counts)] = self.counts
+            self.counts = grown
+
+    # adds values at (rows, columns), all at once
+    def add(self, rows, columns, values):
+        self._fit()
+        if len(rows):
+            np.add.at(self.counts, (np.frombuffer(rows, dtype=np.int64), np.frombuffer(columns, dtype=np.int64)),
+                      np.frombuffer(values, dtype=np.int64))
+
+    def merge(self, user_ids, counts):
+        rows = array("q", (self.row(user_id) for user_id in user_ids))
+        self._fit()
+        self.counts[np.frombuffer(rows, dtype=np.int64)] += counts
+
+    def table(self):
+        return np.frombuffer(self.user_ids, dtype=np.uint64), self.counts[:len(self.user_ids)]
+
+
+# every complete hand from offset on, as (offset just past it, its entries). a
+# hand a game is still playing is left for the next run. the GAME entry a
+# finished game ends with is passed over as an empty hand, so the file isn't
+# read again for it
+def iter_hands(buffer, offset):
+    entries = []
+    results = seats = 0
+    for end, entry in iter_entries(buffer, offset):
+        if entry.kind == GAME:
+            entries = []
+            yield end, entries
+            continue
+        if entry.kind == HAND:
+            entries = []
+            results, seats = 0, entry.value
+        entries.append(entry)
+        if entry.kind == RESULT:
+            results += 1
+            if results == seats:
+                yield end, entries
+                entries = []
+
+
+# (user id, column, amount) for everything a hand adds to the counters
+def hand_updates(entries):
+    positions = {}
+    voluntary = set()
+    raised = set()
+    for entry in entries:
+        user_id = entry.user_id
+        if entry.kind == HAND:
+            # data is (user id, stack) for each seat
+            for seat_user in entry.data[0::2]:
+                positions[seat_user] = NORMAL
+            positions[user_id] = DEALER
+        elif entry.kind == BLIND:
+            # heads up, the dealer is also the small blind, as in Game
+            positions[user_id] = BIG_BLIND if entry.value else SMALL_BLIND
+        elif entry.kind == ACTION:
+            if entry.value == RAISE:
+                yield user_id, BETS, 1
+            elif entry.value == CALL:
+                yield user_id, CALLS, 1
+            if entry.street == PREFLOP and entry.value in (CALL, RAISE):
+                voluntary.add(user_id)
+                if entry.value == RAISE:
+                    raised.add(user_id)
+        elif entry.kind == RESULT:
+            position = positions.get(user_id, NORMAL)
+            net = entry.data[0] if entry.data else 0
+            yield user_id, HANDS, 1
+            yield user_id, POSITION_HANDS + position, 1
+            yield user_id, POSITION_NET + position, net
+            if user_id in voluntary:
+                yield user_id, VPIP, 1
+            if user_id in raised:
+                yield user_id, PFR, 1
+            if entry.value:
+                yield user_id, SHOWDOWNS, 1
+                if entry.amount > 0:
+                    yield user_id, SHOWDOWN_WINS, 1
+
+
+# counts the hands in one file from offset on. returns the user ids and
+# counters found, and the offset to start from next time
+def analyse_file(path, offset):
+    counters = Counters()
+    offset = max(offset, FILE_HEADER.size)
+    if os.path.getsize(path) <= offset:
+        return (path, *counters.table(), offset)
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        check_header(buffer, path)
+        rows, columns, values = array("q"), array("q"), array("q")
+        end = offset
+        for end, entries in iter_hands(buffer, offset):
+            for user_id, column, amount in hand_updates(entries):
+                rows.append(counters.row(user_id))
+                columns.append(column)
+                values.append(amount)
+
+            if len(rows) >= FLUSH_EVERY:
+                counters.add(rows, columns, values)
+                rows, columns, values = array("q"), array("q"), array("q")
+        counters.add(rows, columns, values)
+
+    return (path, *counters.table(), end)
+
+
+def history_files(directory):
+    # absolute, so the checkpoint knows a file however the directory was written
+    return sorted(os.path.realpath(os.path.join(directory, name))
+                  for name in os.listdir(directory) if name.endswith(".pkh"))
+
+
+def load_checkpoint(path):
+    counters = Counters()
+    offsets = {}
+    if path and os.path.exists(path):
+        with np.load(path) as data:
+            counters.merge(data["user_ids"].tolist(), data["counts"])
+            offsets = {os.path.realpath(path): offset
+                       for path, offset in zip(data["files"].tolist(), data["offsets"].tolist())}
+    return counters, offsets
+
+
+def save_checkpoint(path, counters, offsets):
+    user_ids, counts = counters.table()
+    # np.savez adds .npz to names without it, so write to a name that has it
+    temp = path + ".tmp.npz"
+    np.savez(temp, user_ids=user_ids, counts=counts,
+             files=np.array(list(offsets), dtype=str), offsets=np.array(list(offsets.values()), dtype=np.int64))
+    os.replace(temp, path)
+
+
+def summarize(user_ids, counts):
+    stats = {}
+    for user_id, row in zip(user_ids.tolist(), counts.tolist()):
+        hands = row[HANDS]
+        stats[user_id] = {
+            "hands": hands,
+            "vpip": row[VPIP] / hands if hands else 0.0,
+            "pfr": row[PFR] / hands if hands else 0.0,
+            # bets and raises per call
+            "aggression": row[BETS] / row[CALLS] if row[CALLS] else float(row[BETS]),
+            "showdowns": row[SHOWDOWNS],
+            "showdown_win_rate": row[SHOWDOWN_WINS] / row[SHOWDOWNS] if row[SHOWDOWNS] else 0.0,
+            "net": sum(row[POSITION_NET:POSITION_NET + len(POSITION_NAMES)]),
+            "by_position": {name: {"hands": row[POSITION_HANDS + i], "net": row[POSITION_NET + i]}
+                            for i, name in enumerate(POSITION_NAMES)},
+        }
+    return stats
+
+
+def print_report(stats, top):
+    print(f"{'user':<20} {'hands':>8} {'vpip':>6} {'pfr':>6} {'af':>5} {'wsd':>6} {'net':>9}  "
+          + "  ".join(f"{name:>11}" for name in POSITION_NAMES))
+    players = sorted(stats.items(), key=lambda item: -item[1]["hands"])
+    for user_id, s in players[:top]:
+        by_position = "  ".join(f"{s['by_position'][name]['net']:>+11}" for name in POSITION_NAMES)
+        print(f"{user_id:<20} {s['hands']:>8,} {s['vpip']:>6.1%} {s['pfr']:>6.1%} {s['aggression']:>5.2f} "
+              f"{s['showdown_win_rate']:>6.1%} {s['net']:>+9}  {by_position}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per player statistics from hand history files.")
+    parser.add_argument("directory", nargs="?", default=HISTORY_DIR)
+    parser.add_argument("--checkpoint", help="resume from and save progress to this .npz file")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (0 reads every file here)")
+    parser.add_argument("--top", type=int, default=20, help="players to print, most hands first")
+    parser.add_argument("--json", help="write every player's statistics to this file")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+
+    counters, offsets = load_checkpoint(args.checkpoint)
+    tasks = []
+    for path in history_files(args.directory):
+        offset = offsets.get(path, 0)
+        size = os.path.getsize(path)
+        if size < offset:
+            print(f"{path} is shorter than when it was last read; skipping it", file=sys.stderr)
+        elif size > offset:
+            tasks.append((path, offset))
+
+    if args.workers:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results = pool.map(analyse_file, *zip(*tasks)) if tasks else []
+            for path, user_ids, counts, end in results:
+                counters.merge(user_ids.tolist(), counts)
+                offsets[path] = end
+    else:
+        for path, offset in tasks:
+            path, user_ids, counts, end = analyse_file(path, offset)
+            counters.merge(user_ids.tolist(), counts)
+            offsets[path] = end
+
+    if args.checkpoint:
+        save_checkpoint(args.checkpoint, counters, offsets)
+
+    stats = summarize(*counters.table())
+    print(f"{len(tasks)} files read, {len(stats)} players")
+    print_report(stats, args.top)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(stats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# benchmarks for the hand evaluators and the deck.
+#
+#   python benchmark.py                          # print a summary
+#   python benchmark.py --json results.json      # also write machine readable results
+#   python benchmark.py --save-baseline bench_baseline.json
+#   python benchmark.py --baseline bench_baseline.json   # exit 1 on regressions
+#
+# every corpus is generated from --seed, so two runs time exactly the same work.
+# before timing anything, every evaluator is checked against detect_hand's
+# category on every corpus, and any disagreement fails the run.
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from poker.cards import CARDS, Deck, Rank, Suit, Card
+from poker.flops import get_flop_index
+from poker.hands import PokerHand, NUM_HANDS, EvaluationCache, detect_hand, evaluate, strength_category, \
+    has_royal_flush, has_straight_flush, has_four_kind, has_full_house, has_flush, \
+    has_straight, has_three_kind, has_two_pair, has_pair
+
+try:
+    import numpy as np
+    from poker.batch import evaluate_batch, hands_to_array
+except ImportError:
+    np = None
+
+DEFAULT_SEED = 1234
+DEFAULT_SIZE = 20_000
+# how much slower than the baseline a benchmark may get before it fails
+DEFAULT_TOLERANCE = 0.25
+DEAL_PLAYERS = 8
+
+HAS_FUNCS = [has_royal_flush, has_straight_flush, has_four_kind, has_full_house,
+             has_flush, has_straight, has_three_kind, has_two_pair, has_pair]
+
+
+# the original way of classifying a hand: try each has_* function in turn
+def has_chain_category(hand):
+    for i, func in enumerate(HAS_FUNCS):
+        if func(hand):
+            return PokerHand(NUM_HANDS - i - 1)
+    return PokerHand.HIGH_CARD
+
+
+def random_hands(rng, size, count):
+    return [rng.sample(CARDS, size) for _ in range(count)]
+
+
+def _made_hand(rng, category):
+    # categories too rare to find by sampling are built directly
+    suit = rng.choice(list(Suit))
+    if category == PokerHand.ROYAL_FLUSH:
+        ranks = [Rank.TEN, Rank.JACK, Rank.QUEEN, Rank.KING, Rank.ACE]
+        return [Card(suit, r) for r in ranks]
+    if category == PokerHand.STRAIGHT_FLUSH:
+        low = rng.randrange(0, 9)  # five high (the wheel) up to king high
+        return [Card(suit, Rank(low + i)) for i in range(5)]
+    if category == PokerHand.FOUR_KIND:
+        rank = rng.choice(list(Rank))
+        return [Card(s, rank) for s in Suit]
+    return []
+
+
+# `count` 7-card hands of every category
+def stratified_hands(rng, count):
+    corpus = []
+    for category in PokerHand:
+        found = []
+        while len(found) < count:
+            made = _made_hand(rng, category)
+            hand = made + rng.sample([c for c in CARDS if c not in made], 7 - len(made))
+            if has_chain_category(hand) == category:
+                found.append(hand)
+        corpus += found
+    return corpus
+
+
+# shuffled decks with the number of cards a full table would deal
+def deal_sequences(rng, count):
+    decks = [Deck(random.Random(rng.random())) for _ in range(count)]
+    return decks, 2 * DEAL_PLAYERS + 5
+
+
+def build_corpora(seed, size):
+    rng = random.Random(seed)
+    return {
+        "random5": random_hands(rng, 5, size),
+        "random6": random_hands(rng, 6, size),
+        "random7": random_hands(rng, 7, size),
+        "stratified": stratified_hands(rng, max(size // NUM_HANDS, 1)),
+    }
+
+
+def cross_check(corpora):
+    failures = []
+    for name, hands in corpora.items():
+        expected = [detect_hand(hand)[0] for hand in hands]
+        checks = {
+            "has_chain": [has_chain_category(hand) for hand in hands],
+            "evaluate": [strength_category(evaluate(hand)) for hand in hands],
+        }
+        if np is not None:
+            checks["evaluate_batch"] = [PokerHand(c) for c in evaluate_batch(hands_to_array(hands))[1]]
+
+        for evaluator, got in checks.items():
+            bad = sum(1 for e, g in zip(expected, got) if e != g)
+            if bad:
+                failures.append(f"{evaluator} disagrees with detect_hand on {bad} {name} hands")
+    return failures
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+# times func once per item; returns items/sec and per-call latency percentiles.
+# peak memory is measured on a separate pass, since tracemalloc slows calls down
+def time_calls(func, items):
+    clock = time.perf_counter_ns
+    latencies = []
+    start = clock()
+    for item in items:
+        t = clock()
+        func(item)
+        latencies.append(clock() - t)
+    total = clock() - start
+
+    tracemalloc.start()
+    for item in items[:1000]:
+        func(item)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "calls": len(items),
+        "per_sec": len(items) / (total / 1e9),
+        "p50_ns": _percentile(latencies, 0.5),
+        "p90_ns": _percentile(latencies, 0.9),
+        "p99_ns": _percentile(latencies, 0.99),
+        "peak_bytes": peak,
+    }
+
+
+def time_batch(func, array, repeats=5):
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        func(array)
+        times.append(time.perf_counter() - t)
+
+    tracemalloc.start()
+    func(array)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = min(times)
+    return {"calls": len(array), "per_sec": len(array) / best, "batch_s": best, "peak_bytes": peak}
+
+
+def run_benchmarks(corpora, seed, size):
+    results = {}
+    hands7 = corpora["random7"]
+
+    # uncached, so these time the evaluator rather than the cache
+    results["detect_hand/random7"] = time_calls(lambda hand: detect_hand(hand, None), hands7)
+    results["detect_hand/stratified"] = time_calls(lambda hand: detect_hand(hand, None), corpora["stratified"])
+    # the same few hands over and over, as a table's embeds ask for them
+    cache = EvaluationCache()
+    repeated = hands7[:DEAL_PLAYERS] * (len(hands7) // DEAL_PLAYERS)
+    results["detect_hand_cached/random7"] = time_calls(lambda hand: detect_hand(hand, cache), repeated)
+    for size_name in ("random5", "random6"):
+        results[f"evaluate/{size_name}"] = time_calls(evaluate, corpora[size_name])
+    results["evaluate/random7"] = time_calls(evaluate, hands7)
+    results["has_chain/random7"] = time_calls(has_chain_category, hands7)
+    for func in HAS_FUNCS:
+        results[f"{func.__name__}/random7"] = time_calls(func, hands7)
+
+    if np is not None:
+        results["evaluate_batch/random7"] = time_batch(evaluate_batch, hands_to_array(hands7))
+
+    rng = random.Random(seed)
+    deck = Deck(random.Random(rng.random()))
+    results["deck_shuffle"] = time_calls(lambda _: deck.shuffle(), range(size))
+    results["deck_deal_many"] = time_calls(lambda _: deck.shuffle().deal_many(DEAL_PLAYERS, 2, 5), range(size))
+
+    decks, per_deck = deal_sequences(rng, size)
+
+    def deal_all(deck):
+        for _ in range(per_deck):
+            deck.deal()
+
+    results["deck_deal"] = time_calls(deal_all, decks)
+    # reported per card rather than per deck
+    results["deck_deal"]["per_sec"] *= per_deck
+
+    flop_index = get_flop_index()
+    if flop_index is not None:
+        flops = [[card.id for card in deck.shuffle().deal_many(0, 0, 3)[1]] for _ in range(size)]
+        results["flop_lookup"] = time_calls(flop_index.lookup, flops)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, old in baseline["results"].items():
+        new = results.get(name)
+        if new and new["per_sec"] < old["per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {new['per_sec']:,.0f}/s vs baseline {old['per_sec']:,.0f}/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hand evaluators and the deck.")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="hands per corpus")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="fail if slower than the results in this file")
+    parser.add_argument("--save-baseline", help="write results to this file as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    corpora = build_corpora(args.seed, args.size)
+
+    failures = cross_check(corpora)
+    for failure in failures:
+        print("MISMATCH:", failure)
+    if failures:
+        sys.exit(1)
+
+    results = run_benchmarks(corpora, args.seed, args.size)
+    report = {
+        "seed": args.seed,
+        "size": args.size,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    for name, r in results.items():
+        latency = f"p50 {r['p50_ns']:>7,} ns  p99 {r['p99_ns']:>8,} ns" if "p50_ns" in r else ""
+        print(f"{name:<28} {r['per_sec']:>14,.0f}/s  {latency:<36} peak {r['peak_bytes']:>10,} B")
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
+import asyncio
 import discord
 import os
 import random
-from asyncio import sleep
 from helpers import *
-from poker.game import Game
+from poker.bank import AsyncBank, Bank, DEFAULT_BALANCE
+from poker.compute import get_compute
+from poker.engine import BIG_BLIND
+from poker.events import EventRouter
+from poker.game import Game, load_emojis
+from poker.hands import EVALUATION_CACHE
+from poker.lobby import Lobby
+from poker.metrics import METRICS, TEXTFILE_PATH, sample_loop_lag, write_textfile_periodically
+from poker.registry import GameRegistry
 
 
 client = discord.Client(request_offline_members=False)
@@ -12,12 +20,60 @@ TOKEN = os.environ.get("BOT_TOKEN")
 JOIN_TIMEOUT = 8
 MAX_PLAYERS = 8
 
-games = []
+# each command's aliases; the key is the command's name in the metrics
+COMMANDS = {
+    "hello": ["hello", "hi", "hey"],
+    "where": ["where", "whereami"],
+    "dice": ["die", "dice"],
+    "coin": ["coin", "coinflip"],
+    "game": ["game", "startgame", "start"],
+    "cancel": ["cancel"],
+    "balance": ["balance", "bal"],
+    "leaderboard": ["leaderboard", "top"],
+    "game?": ["game?"],
+    "stats": ["stats"],
+}
+COMMAND_NAMES = {alias: name for name, aliases in COMMANDS.items() for alias in aliases}
+# discord messages can't be longer than this
+MAX_MESSAGE_LENGTH = 2000
+
+games = GameRegistry()
+bank = AsyncBank(Bank())
+router = EventRouter()
+# author id -> the lobby they have open
+lobbies = {}
+# started once, on the first on_ready
+background_tasks = []
+
+METRICS.gauge("games_active", lambda: len(games))
+METRICS.gauge("lobbies_open", lambda: len(lobbies))
+METRICS.gauge("events_waiting", lambda: len(router))
+METRICS.gauge("compute_jobs_running", lambda: len(get_compute()))
+METRICS.gauge("evaluation_cache_size", lambda: len(EVALUATION_CACHE))
+METRICS.gauge("evaluation_cache_hits", lambda: EVALUATION_CACHE.hits)
+METRICS.gauge("evaluation_cache_misses", lambda: EVALUATION_CACHE.misses)
+METRICS.gauge("evaluation_cache_evictions", lambda: EVALUATION_CACHE.evictions)
 
 
 @client.event
 async def on_ready():
     print(f"Successfully logged in as {client.user} with ID {client.user.id}")
+    load_emojis(client)
+
+    if not background_tasks:
+        background_tasks.append(asyncio.ensure_future(sample_loop_lag()))
+        if TEXTFILE_PATH:
+            background_tasks.append(asyncio.ensure_future(write_textfile_periodically(TEXTFILE_PATH)))
+
+
+@client.event
+async def on_raw_reaction_add(payload):
+    router.dispatch_reaction(payload)
+
+
+@client.event
+async def on_raw_reaction_remove(payload):
+    router.dispatch_reaction_remove(payload)
 
 
 @client.event
@@ -28,12 +84,15 @@ async def on_message(message):
     author = message.author
     msg = message.content
 
-    # clear empty games
-    global games
-    games = [game for game in games if game.active]
-
     # don't respond to self
-    if author == client.user or not is_command(msg):
+    if author == client.user:
+        return
+
+    # answers to a game's prompts (e.g. raise amounts) go to that game
+    if router.dispatch_message(message):
+        return
+
+    if not is_command(msg):
         return
 
     print(f"Received command attempt \"{msg}\" from {author} in {channel} in {guild}")
@@ -43,71 +102,116 @@ async def on_message(message):
     args = parts[1:]
 
 
-    if cmd in ["hello", "hi", "hey"]:
-        await send(f"Hello, {author.mention}! :smile:")
+    # waits on players (the lobby and the game itself) are paused out, so this is the bot's own time
+    with METRICS.time("command_seconds", pausable=True, command=COMMAND_NAMES.get(cmd, "unknown")) as timer:
+        if cmd in COMMANDS["hello"]:
+            await send(f"Hello, {author.mention}! :smile:")
 
 
-    elif cmd in ["where", "whereami"]:
-        await send(f"We are in the server **{guild.name}** in the channel {channel.mention}! :smile:")
+        elif cmd in COMMANDS["where"]:
+            await send(f"We are in the server **{guild.name}** in the channel {channel.mention}! :smile:")
 
 
-    elif cmd in ["die", "dice"]:
-        await send(f"Rolled a {random.choice(range(1, 6))}.")
+        elif cmd in COMMANDS["dice"]:
+            await send(f"Rolled a {random.choice(range(1, 6))}.")
 
 
-    elif cmd in ["coin", "coinflip"]:
-        await send(f"Flipped {'Heads' if (random.random() > 0.5) else 'Tails'}.")
+        elif cmd in COMMANDS["coin"]:
+            await send(f"Flipped {'Heads' if (random.random() > 0.5) else 'Tails'}.")
 
 
-    # TODO: disallow people already in games
-    elif cmd in ["game", "startgame", "start"]:
-        pre_message = f"{author.mention} is starting a poker game! React to this message to join! "
-        game_message = await send(pre_message + f"{JOIN_TIMEOUT} seconds left!")
-        await game_message.add_reaction("✅")
+        elif cmd in COMMANDS["game"]:
+            if games.in_game(author.id) or author.id in lobbies:
+                await send("You are already in a game! :slight_frown:")
+                return
 
-        await sleep(JOIN_TIMEOUT / 4)
+            pre_message = f"{author.mention} is starting a poker game! React to this message to join " \
+                          f"({COMMAND_START}cancel to cancel)! "
+            lobby = Lobby(client, author, MAX_PLAYERS, is_free=lambda user_id: not games.in_game(user_id))
+            game_message = await send(pre_message + f"{JOIN_TIMEOUT} seconds left!")
 
-        for i in range(3, 0, -1):
-            await game_message.edit(content=pre_message + f"{i / 4 * JOIN_TIMEOUT} seconds left!")
-            await sleep(JOIN_TIMEOUT / 4)
+            lobbies[author.id] = lobby
+            try:
+                with timer.paused():
+                    reactors = await lobby.run(router, game_message, pre_message, JOIN_TIMEOUT)
+            finally:
+                del lobbies[author.id]
 
-        reactors = [author]
-        cache_msg = discord.utils.get(client.cached_messages, id=game_message.id)
+            if reactors is None:
+                await game_message.edit(content="The game was cancelled. :slight_frown:")
+                await game_message.clear_reactions()
+                return
 
-        for reaction in cache_msg.reactions:
-            async for user in reaction.users():
-                if user.id not in [r.id for r in reactors] and user != client.user:
-                    reactors.append(user)
-                if len(reactors) == MAX_PLAYERS:
-                    break
+            guild_id = guild.id if guild else None
+            balances = await bank.balances(guild_id, [r.id for r in reactors])
+            # players who can't pay the big blind start over
+            broke = {user_id: DEFAULT_BALANCE for user_id, balance in balances.items() if balance < BIG_BLIND}
+            if broke:
+                await bank.set_balances(guild_id, broke)
+                balances.update(broke)
+
+            # anyone may have joined another game during the countdown
+            reactors = [r for r in reactors if not games.in_game(r.id)]
+
+            if len(reactors) < 2:
+                await game_message.edit(content="Not enough players reacted; the game is cancelled. :slight_frown:")
+                await game_message.clear_reactions()
+                return
+
+            # registered before anything else is awaited, so nobody can join two games
+            game = Game(reactors, client, router, bank=bank, guild_id=guild_id, balances=balances)
+            games.add(game, channel.id, guild_id)
+
+            try:
+                await game_message.edit(content=f"{author.mention} has started a poker game! "
+                                                f"Players: {english_list(reactors, lambda r: r.mention)}")
+                await game_message.clear_reactions()
+
+                await game.deal_to_all()
+                # await game.send_embed()
+                with timer.paused():
+                    await game.round()
+            finally:
+                game.finish()
+
+
+        elif cmd in COMMANDS["cancel"]:
+            lobby = lobbies.get(author.id)
+            if lobby:
+                lobby.cancel()
             else:
-                continue
-            break
+                await send("You don't have a game waiting for players.")
+
+
+        elif cmd in COMMANDS["balance"]:
+            balance = (await bank.balances(guild.id if guild else None, [author.id]))[author.id]
+            await send(f"{author.mention}, you have {balance} chips.")
 
-        if len(reactors) < 2:
-            await game_message.edit(content=f"Not enough players reacted; the game is cancelled. :slight_frown:")
-            await game_message.clear_reactions()
-            return
 
-        await game_message.edit(content=f"{author.mention} has started a poker game! "
-                                        f"Players: {english_list(reactors, lambda r: r.mention)}")
-        await game_message.clear_reactions()
+        elif cmd in COMMANDS["leaderboard"]:
+            top = await bank.leaderboard(guild.id if guild else None)
+            if top:
+                await send("\n".join(f"{i + 1}. <@{user_id}>: {balance}" for i, (user_id, balance) in enumerate(top)),
+                           allowed_mentions=discord.AllowedMentions.none())
+            else:
+                await send("Nobody has played here yet.")
+
 
-        game = Game(reactors, client)
-        games.append(game)
-        await game.deal_to_all()
-        # await game.send_embed()
-        await game.round()
+        elif cmd in COMMANDS["stats"]:
+            stats = METRICS.summary()
+            if len(stats) > MAX_MESSAGE_LENGTH - 8:
+                stats = stats[:MAX_MESSAGE_LENGTH - 12] + "\n..."
+            await send(f"```\n{stats}\n```")
 
 
-    elif cmd in ["game?"]:
-        game = discord.utils.find(lambda g: author in g.players, games)
+        elif cmd in COMMANDS["game?"]:
+            game = games.game_of(author.id)
 
-        if game:
-            players_but = [p for p in game.players if p != author]
-            await send(f"You are in a game with {english_list(players_but, lambda p: p.mention)}.")
-        else:
-            await send("You are not currrently in a game.")
+            if game:
+                players_but = [p for p in game.players if p.user.id != author.id]
+                await send(f"You are in a game with {english_list(players_but, lambda p: p.mention)}.")
+            else:
+                await send("You are not currrently in a game.")
 
 
 client.run(TOKEN)
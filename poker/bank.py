@@ -0,0 +1,234 @@
+# players' chips between games, per guild, in sqlite. the database runs in wal
+# mode so reads never wait for writes. all writes go through one writer thread:
+# every hand waiting when it wakes up is committed in the same transaction, so
+# many games finishing hands at once cost one commit rather than one each.
+# AsyncBank wraps it all for the event loop.
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BANK_PATH = os.environ.get("BANK_PATH", "bank.sqlite3")
+# the balance a player has in a guild they haven't played in
+DEFAULT_BALANCE = 1000
+POOL_SIZE = 4
+# milliseconds a connection waits for a lock before giving up
+BUSY_TIMEOUT = 5000
+LEADERBOARD_SIZE = 10
+
+DELTAS, SET = range(2)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS balances (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    balance INTEGER NOT NULL,
+    hands INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS balances_leaderboard ON balances (guild_id, balance DESC);
+"""
+
+# a hand adds delta to the balance, starting from the default for a new player
+APPLY_DELTA = """
+INSERT INTO balances (guild_id, user_id, balance, hands) VALUES (?, ?, ?, 1)
+ON CONFLICT (guild_id, user_id) DO UPDATE SET balance = balance + ?, hands = hands + 1
+"""
+SET_BALANCE = """
+INSERT INTO balances (guild_id, user_id, balance) VALUES (?, ?, ?)
+ON CONFLICT (guild_id, user_id) DO UPDATE SET balance = excluded.balance
+"""
+
+
+def _guild_key(guild_id):
+    # games in dms have no guild
+    return guild_id or 0
+
+
+def connect(path):
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT / 1000, isolation_level=None,
+                                 check_same_thread=False)
+    connection.execute("PRAGMA journal_mode = WAL")
+    # in wal mode, normal only risks the last commits on power loss, never corruption
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT}")
+    return connection
+
+
+class Bank:
+    def __init__(self, path=BANK_PATH, pool_size=POOL_SIZE, default_balance=DEFAULT_BALANCE):
+        self.path = path
+        self.pool_size = pool_size
+        self.default_balance = default_balance
+
+        self._writer = connect(path)
+        self._writer.executescript(SCHEMA)
+        # connections for reads, handed out one caller at a time
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(connect(path))
+
+    def _read(self, query, params):
+        connection = self._pool.get()
+        try:
+            return connection.execute(query, params).fetchall()
+        finally:
+            self._pool.put(connection)
+
+    # user id -> balance for each of user_ids, with the default for new players
+    def balances(self, guild_id, user_ids):
+        user_ids = list(user_ids)
+        rows = self._read(f"SELECT user_id, balance FROM balances WHERE guild_id = ? "
+                          f"AND user_id IN ({', '.join('?' * len(user_ids))})",
+                          [_guild_key(guild_id)] + user_ids)
+        found = dict(rows)
+        return {user_id: found.get(user_id, self.default_balance) for user_id in user_ids}
+
+    # the richest limit players in a guild as (user id, balance), using the index
+    def leaderboard(self, guild_id, limit=LEADERBOARD_SIZE):
+        return self._read("SELECT user_id, balance FROM balances WHERE guild_id = ? "
+                          "ORDER BY balance DESC LIMIT ?", (_guild_key(guild_id), limit))
+
+    # writes go through a single connection, so only one thread (AsyncBank's
+    # writer, or whoever owns a Bank used without one) may call these
+
+    # commits any number of hands, each (guild id, {user id: change in chips}), in one transaction
+    def apply_hands(self, hands):
+        with self.transaction():
+            self._apply_hands(hands)
+
+    def set_balances(self, guild_id, balances):
+        with self.transaction():
+            self._set_balances(guild_id, balances)
+
+    def _apply_hands(self, hands):
+        self._writer.executemany(APPLY_DELTA, [(_guild_key(guild_id), user_id, self.default_balance + delta, delta)
+                                               for guild_id, deltas in hands for user_id, delta in deltas.items()])
+
+    def _set_balances(self, guild_id, balances):
+        self._writer.executemany(SET_BALANCE, [(_guild_key(guild_id), user_id, balance)
+                                               for user_id, balance in balances.items()])
+
+    def transaction(self):
+        return _Transaction(self._writer)
+
+    def close(self):
+        self._writer.close()
+        while not self._pool.empty():
+            self._pool.get().close()
+
+
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        # take the write lock up front rather than upgrading to it halfway through
+        self.connection.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.connection.execute("ROLLBACK")
+            return
+        try:
+            self.connection.execute("COMMIT")
+        except sqlite3.Error:
+            # a failed commit leaves the transaction open
+            self.connection.execute("ROLLBACK")
+            raise
+
+
+class AsyncBank:
+    def __init__(self, bank):
+        self.bank = bank
+        self._readers = ThreadPoolExecutor(max_workers=bank.pool_size, thread_name_prefix="bank-read")
+        # (write, guild id, values, loop, future) waiting to be written, where
+        # write is DELTAS (values are a hand's changes) or SET; None stops the writer
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="bank-write", daemon=True)
+        self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._writes.get()]
+            # everything else already waiting goes in the same transaction
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            batch = [item for item in batch if item is not None]
+            if batch:
+                try:
+                    self._commit(batch)
+                    errors = [None] * len(batch)
+                except Exception:
+                    # one bad write mustn't fail the rest: write each on its own
+                    # to find out which, and tell only its caller
+                    errors = [self._commit_alone(item) for item in batch]
+
+                for (_, _, _, loop, future), error in zip(batch, errors):
+                    try:
+                        loop.call_soon_threadsafe(_settle, future, error)
+                    except RuntimeError:
+                        # the caller's loop has closed; nobody is waiting
+                        pass
+            if stop:
+                return
+
+    def _commit(self, batch):
+        with self.bank.transaction():
+            for write, guild_id, values, _, _ in batch:
+                if write == DELTAS:
+                    self.bank._apply_hands([(guild_id, values)])
+                else:
+                    self.bank._set_balances(guild_id, values)
+
+    # the exception committing item raised, or None
+    def _commit_alone(self, item):
+        try:
+            self._commit([item])
+        except Exception as e:
+            return e
+        return None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._readers, func, *args)
+
+    async def balances(self, guild_id, user_ids):
+        return await self._run(self.bank.balances, guild_id, user_ids)
+
+    async def leaderboard(self, guild_id, limit=LEADERBOARD_SIZE):
+        return await self._run(self.bank.leaderboard, guild_id, limit)
+
+    async def _write(self, write, guild_id, values):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._writes.put((write, guild_id, dict(values), loop, future))
+        await future
+
+    # both return once the change is committed
+    async def commit_hand(self, guild_id, deltas):
+        await self._write(DELTAS, guild_id, deltas)
+
+    async def set_balances(self, guild_id, balances):
+        await self._write(SET, guild_id, balances)
+
+    def close(self):
+        self._writes.put(None)
+        self._writer.join()
+        self._readers.shutdown()
+        self.bank.close()
+
+
+def _settle(future, error):
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
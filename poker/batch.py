@@ -0,0 +1,81 @@
+# vectorized version of poker.hands.evaluate for arrays of card ids.
+# it uses the same tables, so strengths and categories match evaluate() and
+# PokerHand exactly
+import numpy as np
+
+from poker.cards import NUM_RANKS, NUM_SUITS, CARDS_IN_DECK
+from poker.hands import FLUSH_TABLE, SPREAD_TABLE, RANK_TABLE, CATEGORY_SHIFT
+
+# rows evaluated at once; bounds the size of the temporary arrays
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+FLUSH = np.array(FLUSH_TABLE, dtype=np.int32)
+SPREAD = np.array(SPREAD_TABLE, dtype=np.int64)
+RANK_KEYS = np.array(sorted(RANK_TABLE), dtype=np.int64)
+RANK_VALUES = np.array([RANK_TABLE[key] for key in RANK_KEYS.tolist()], dtype=np.int32)
+
+# the rank key of one card of each rank; a hand's key is the sum over its cards
+RANK_UNIT = SPREAD[np.left_shift(1, np.arange(NUM_RANKS))]
+
+CARD_MASK = np.left_shift(np.uint64(1), np.arange(CARDS_IN_DECK, dtype=np.uint64))
+BLOCK = np.uint64((1 << NUM_RANKS) - 1)
+
+
+def hands_to_array(hands):
+    return np.array([[c.id for c in hand] for hand in hands], dtype=np.int8)
+
+
+def hand_masks(ids):
+    masks = np.zeros(len(ids), dtype=np.uint64)
+    for column in range(ids.shape[1]):
+        masks |= CARD_MASK[ids[:, column]]
+    return masks
+
+
+def evaluate_masks(masks):
+    flush = np.zeros(len(masks), dtype=np.int32)
+    key = np.zeros(len(masks), dtype=np.int64)
+
+    for suit in range(NUM_SUITS):
+        block = ((masks >> np.uint64(suit * NUM_RANKS)) & BLOCK).astype(np.intp)
+        np.maximum(flush, FLUSH[block], out=flush)
+        key += SPREAD[block]
+
+    return np.where(flush > 0, flush, evaluate_rank_keys(key))
+
+
+# base-5 rank keys (see poker.hands) of card masks, ignoring suits
+def rank_keys(masks):
+    key = np.zeros(len(masks), dtype=np.int64)
+    for suit in range(NUM_SUITS):
+        key += SPREAD[((masks >> np.uint64(suit * NUM_RANKS)) & BLOCK).astype(np.intp)]
+    return key
+
+
+# strengths of rank keys, for hands that can't hold a flush
+def evaluate_rank_keys(keys):
+    return RANK_VALUES[np.searchsorted(RANK_KEYS, keys)]
+
+
+def categories(strengths):
+    return (np.asarray(strengths) >> CATEGORY_SHIFT).astype(np.int8)
+
+
+# ids is an (N, k) integer array of card ids, 1 <= k <= 7, with no repeated
+# card in a row. returns (strengths, categories), both of shape (N,)
+def evaluate_batch(ids, chunk_size=DEFAULT_CHUNK_SIZE):
+    ids = np.asarray(ids)
+    assert ids.ndim == 2 and 1 <= ids.shape[1] <= 7, "must pass an (N, k) array with 1 <= k <= 7"
+
+    strengths = np.empty(len(ids), dtype=np.int32)
+    for start in range(0, len(ids), chunk_size):
+        strengths[start:start + chunk_size] = evaluate_masks(hand_masks(ids[start:start + chunk_size]))
+
+    return strengths, categories(strengths)
+
+
+# streaming version: evaluates an iterable of (n, k) id arrays (e.g. slices of
+# a memory-mapped corpus) one chunk at a time, so N never has to fit in memory
+def evaluate_chunks(chunks, chunk_size=DEFAULT_CHUNK_SIZE):
+    for chunk in chunks:
+        yield evaluate_batch(chunk, chunk_size)
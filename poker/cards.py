@@ -1,6 +1,6 @@
 from enum import Enum
 from helpers import capitalize
-from random import shuffle
+import random
 
 NUM_SUITS = 4
 NUM_RANKS = 13
@@ -16,58 +16,142 @@ class Rank(Enum):
         NINE, TEN, JACK, QUEEN, KING = range(NUM_RANKS)
 
 
+# cards are interned: there are exactly 52 Card objects, one per id.
+# a card's id is suit * NUM_RANKS + rank, so each suit occupies a 13-bit block
+# of a 64-bit card mask (bit = 1 << id), which the hand evaluators rely on
 class Card:
-    def __init__(self, s: Suit, r: Rank):
+    __slots__ = ("suit", "rank", "id", "mask", "order")
+
+    def __new__(cls, s: Suit, r: Rank):
         assert isinstance(s, Suit) and isinstance(r, Rank), \
             "must pass in Suit and Rank objects to initialize a Card"
-        self.suit = s
-        self.rank = r
-
+        return CARDS[s.value * NUM_RANKS + r.value]
+
+    @classmethod
+    def _make(cls, s, r):
+        card = object.__new__(cls)
+        set_attr = object.__setattr__
+        set_attr(card, "suit", s)
+        set_attr(card, "rank", r)
+        set_attr(card, "id", s.value * NUM_RANKS + r.value)
+        set_attr(card, "mask", 1 << card.id)
+        # sort key: rank first, then suit (same ordering as before interning)
+        set_attr(card, "order", r.value * NUM_SUITS + s.value)
+        return card
+
+    def __setattr__(self, name, value):
+        raise AttributeError("cards are immutable")
+
+    def __reduce__(self):
+        # keeps cards interned when pickled (e.g. sent to worker processes)
+        return card_from_id, (self.id,)
 
     def __str__(self):
         return capitalize(self.rank.name) + " of " + capitalize(self.suit.name)
 
+    def __repr__(self):
+        return f"Card({self.suit}, {self.rank})"
 
     def __lt__(self, other):
-        assert isinstance(other, Card), "operator < must be used with two Cards"
-        if self.rank != other.rank:
-            return self.rank.value < other.rank.value
-        else:
-            return self.suit.value < other.suit.value
-
+        return self.order < other.order
 
     def __gt__(self, other):
-        assert isinstance(other, Card), "operator > must be used with two Cards"
-        if self.rank != other.rank:
-            return self.rank.value > other.rank.value
-        else:
-            return self.suit.value > other.suit.value
-
+        return self.order > other.order
 
     def __eq__(self, other):
-        assert isinstance(other, Card), "operator == must be used with two Cards"
-        return not (self < other or self > other)
+        return self is other
 
+    def __hash__(self):
+        return self.id
 
-class Deck:
-    def __init__(self):
-        self.cards = []
 
-        for s in Suit:
-            for r in Rank:
-                self.cards.append(Card(s, r))
+CARDS = tuple(Card._make(s, r) for s in Suit for r in Rank)
+assert len(CARDS) == NUM_SUITS * NUM_RANKS == CARDS_IN_DECK, "deck is invalid"
+
+FULL_DECK = bytes(range(CARDS_IN_DECK))
+
+
+def card_from_id(card_id):
+    return CARDS[card_id]
+
 
-        assert len(self.cards) == NUM_SUITS * NUM_RANKS == CARDS_IN_DECK, "deck is invalid"
+# how many ways to choose k cards from n (math.comb needs python 3.8)
+def binomial(n, k):
+    if not 0 <= k <= n:
+        return 0
+    result = 1
+    for i in range(min(k, n - k)):
+        result = result * (n - i) // (i + 1)
+    return result
 
 
+def cards_to_ids(cards):
+    return [c.id for c in cards]
+
+
+def cards_to_mask(cards):
+    mask = 0
+    for c in cards:
+        mask |= c.mask
+    return mask
+
+
+def mask_to_cards(mask):
+    return [c for c in CARDS if mask & c.mask]
+
+
+class Deck:
+    # ids is a permutation buffer of card ids, reused by every shuffle; the
+    # first `remaining` are still in the deck. dealing is a lazy Fisher-Yates
+    # shuffle: each deal swaps a random remaining card to the end and hands it
+    # out, so a hand only pays for the cards it uses and shuffle() is free.
+    #
+    # rng is any random.Random; with one seeded the same way (see seeded), the
+    # same cards come out in the same order, so a deal can be replayed
+    def __init__(self, rng=None):
+        self.ids = bytearray(FULL_DECK)
+        self.remaining = CARDS_IN_DECK
+        self.rng = rng
+        self._random = (rng or random).random
+        self.seed = None
+
+    @classmethod
+    def seeded(cls, seed):
+        deck = cls(random.Random(seed))
+        deck.seed = seed
+        return deck
+
+    @property
+    def cards(self):
+        return [CARDS[i] for i in self.ids[:self.remaining]]
+
+    # puts every card back
     def shuffle(self):
-        shuffle(self.cards)
+        self.remaining = CARDS_IN_DECK
         return self
 
+    def _draw(self):
+        ids = self.ids
+        last = self.remaining - 1
+        i = int(self._random() * self.remaining)
+        ids[i], ids[last] = ids[last], ids[i]
+        self.remaining = last
+        return ids[last]
 
     def deal(self):
-        return self.cards.pop() if self.cards else None
-
+        return CARDS[self._draw()] if self.remaining else None
+
+    # num_hands hands of hand_size cards each, then board_size cards for the
+    # board, dealt in that order in one call
+    def deal_many(self, num_hands, hand_size, board_size=0):
+        assert num_hands * hand_size + board_size <= self.remaining, "not enough cards left"
+        draw = self._draw
+        hands = [[CARDS[draw()] for _ in range(hand_size)] for _ in range(num_hands)]
+        board = [CARDS[draw()] for _ in range(board_size)]
+        return hands, board
+
+    def __len__(self):
+        return self.remaining
 
     def __str__(self):
         return str(list(map(str, self.cards)))
@@ -0,0 +1,86 @@
+# runs the heavy poker computations (equity, runouts) off the event
+# loop, so one busy table can't hold up heartbeats and every other game.
+#
+# jobs are keyed by what they compute (e.g. the cards); a job already running
+# for a key is joined rather than started again, and recent results are kept.
+# within() gives a job a latency budget: past it, the caller gets None and
+# renders without the result, and the job keeps running for the next caller
+# (or for a callback registered with on_done).
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# threads for jobs. the heavy parts (numpy, and equity's own process pool) release the gil
+NUM_THREADS = 4
+# seconds a job may take before within() gives up on it
+DEFAULT_BUDGET = 0.25
+# finished results kept
+CACHE_SIZE = 1024
+
+
+class Compute:
+    def __init__(self, executor=None, budget=DEFAULT_BUDGET, cache_size=CACHE_SIZE):
+        self.executor = executor or ThreadPoolExecutor(max_workers=NUM_THREADS, thread_name_prefix="compute")
+        self.budget = budget
+        self.cache_size = cache_size
+        self._inflight = {}
+        self._results = OrderedDict()
+
+    def _job(self, key, func, args, cache):
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(asyncio.get_event_loop().run_in_executor(self.executor, func, *args))
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._finished(key, done, cache))
+        return future
+
+    def _finished(self, key, future, cache):
+        del self._inflight[key]
+        if not cache or future.cancelled() or future.exception() is not None:
+            return
+        self._results[key] = future.result()
+        if len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+
+    # func(*args), computed once for everyone asking for key at the same time.
+    # results the caller will change (e.g. Runouts) shouldn't be cached
+    async def run(self, key, func, *args, cache=True):
+        if key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key]
+        # shielded, so a caller that stops waiting doesn't cancel it for everyone else
+        return await asyncio.shield(self._job(key, func, args, cache))
+
+    # like run, but returns None if the result isn't ready within budget seconds
+    async def within(self, key, func, *args, budget=None, cache=True):
+        try:
+            return await asyncio.wait_for(self.run(key, func, *args, cache=cache),
+                                          self.budget if budget is None else budget)
+        except asyncio.TimeoutError:
+            return None
+
+    # calls callback with the result once the job for key finishes (if it succeeds)
+    def on_done(self, key, callback):
+        future = self._inflight.get(key)
+        if future is None:
+            if key in self._results:
+                callback(self._results[key])
+            return
+
+        def done(finished):
+            if not finished.cancelled() and finished.exception() is None:
+                callback(finished.result())
+        future.add_done_callback(done)
+
+    def __len__(self):
+        return len(self._inflight)
+
+
+_compute = None
+
+
+def get_compute():
+    global _compute
+    if _compute is None:
+        _compute = Compute()
+    return _compute
@@ -0,0 +1,251 @@
+# a single hand of no limit hold'em as a plain synchronous state machine, with
+# no discord in sight. Game drives one of these per hand (and turns its state
+# into messages and embeds); simulations drive thousands of them directly.
+#
+# seats are numbered in turn order and seat 0 is the dealer. heads up, the
+# dealer posts the small blind and acts first before the flop; otherwise the
+# two seats after the dealer post the blinds and the next one acts first.
+# after the flop, the first seat after the dealer still in the hand starts.
+from poker.cards import Deck
+from poker.hands import evaluate_mask
+
+PLAYER_HAND_SIZE = 2
+FLOP_SIZE = 3
+TABLE_SIZE = 5
+
+SMALL_BLIND = 5
+BIG_BLIND = 10
+
+# same values as TurnTypes in poker.game
+CHECK, CALL, RAISE, FOLD = range(4)
+ACTION_NAMES = ["check", "call", "raise", "fold"]
+PREFLOP, FLOP, TURN, RIVER = range(4)
+STREET_NAMES = ["preflop", "flop", "turn", "river"]
+
+
+class HandState:
+    def __init__(self, stacks, deck=None, hole=None, small_blind=SMALL_BLIND, big_blind=BIG_BLIND):
+        self.num_seats = num_seats = len(stacks)
+        assert num_seats >= 2, "a hand needs at least two players"
+
+        self.deck = deck if deck is not None else Deck()
+        # without hole cards given, the board is dealt up front along with them,
+        # and revealed street by street
+        self._runout = []
+        if hole is None:
+            hole, self._runout = self.deck.deal_many(num_seats, PLAYER_HAND_SIZE, TABLE_SIZE)
+        self.hole = hole
+        self._hole_masks = [cards[0].mask | cards[1].mask for cards in self.hole]
+        self.board = []
+        self._board_mask = 0
+
+        self.stacks = list(stacks)
+        # chips put in on this street, and over the whole hand
+        self.bets = [0] * num_seats
+        self.committed = [0] * num_seats
+        self.folded = [False] * num_seats
+        self.big_blind = big_blind
+        # seats that haven't folded, and those of them with chips left to bet
+        self._num_in_hand = num_seats
+        self._num_actors = sum(1 for stack in self.stacks if stack > 0)
+
+        self.street = PREFLOP
+        self.finished = False
+        # set at the end of the hand: chips each seat won from the pots, chips
+        # handed back to each seat because nobody called them, and the showdown
+        # strengths (None for seats that folded, or if nobody showed down)
+        self.winnings = None
+        self.refunds = None
+        self.strengths = None
+        # (seat, action, amount, street) for everything that happened
+        self.actions = []
+
+        if num_seats == 2:
+            self.small_blind_seat, self.big_blind_seat = 0, 1
+        else:
+            self.small_blind_seat, self.big_blind_seat = 1, 2
+        self._put(self.small_blind_seat, small_blind)
+        self._put(self.big_blind_seat, big_blind)
+
+        self.current_bet = max(self.bets)
+        # the smallest amount a raise has to add to the current bet
+        self.min_raise = big_blind
+        self.turn = (self.big_blind_seat + 1) % num_seats
+        self._start_betting(self.turn)
+
+    @property
+    def pot(self):
+        return sum(self.committed)
+
+    def _can_act(self, seat):
+        return not self.folded[seat] and self.stacks[seat] > 0
+
+    def _put(self, seat, amount):
+        stack = self.stacks[seat]
+        if amount >= stack:
+            amount = stack
+            if stack:
+                self._num_actors -= 1
+        self.stacks[seat] = stack - amount
+        self.bets[seat] += amount
+        self.committed[seat] += amount
+        return amount
+
+    def _next_seat(self, seat):
+        num_seats, folded, stacks = self.num_seats, self.folded, self.stacks
+        for i in range(1, num_seats + 1):
+            nxt = (seat + i) % num_seats
+            if stacks[nxt] and not folded[nxt]:
+                return nxt
+        return -1
+
+    def _start_betting(self, first):
+        # how many more players have to act before this betting round is over
+        self._to_act = self._num_actors
+        # the bet each seat had matched when it last acted this street (None
+        # if it hasn't yet). a seat may only raise again once the bet has gone
+        # up by at least a full raise since, so an all in for less than that
+        # can be called or folded to but not raised by players who have acted
+        self._matched = [None] * self.num_seats
+        self.turn = first if self._can_act(first) else self._next_seat(first)
+        self._advance(moved=False)
+
+    def to_call(self):
+        return min(self.current_bet - self.bets[self.turn], self.stacks[self.turn])
+
+    def min_raise_to(self):
+        return min(self.current_bet + self.min_raise, self.max_raise_to())
+
+    def max_raise_to(self):
+        return self.bets[self.turn] + self.stacks[self.turn]
+
+    def legal_actions(self):
+        seat = self.turn
+        bet = self.bets[seat]
+        actions = [CHECK if bet == self.current_bet else CALL]
+        matched = self._matched[seat]
+        if bet + self.stacks[seat] > self.current_bet and \
+                (matched is None or self.current_bet - matched >= self.min_raise):
+            actions.append(RAISE)
+        actions.append(FOLD)
+        return actions
+
+    # raise_to is the player's total bet for the street after raising
+    def act(self, action, raise_to=0):
+        assert not self.finished, "the hand is over"
+        seat = self.turn
+        amount = 0
+
+        if action == FOLD:
+            self.folded[seat] = True
+            self._num_in_hand -= 1
+            self._num_actors -= 1
+        elif action == CHECK:
+            assert self.bets[seat] == self.current_bet, "can't check facing a bet"
+        elif action == CALL:
+            amount = self._put(seat, self.current_bet - self.bets[seat])
+        elif action == RAISE:
+            assert RAISE in self.legal_actions(), "the betting hasn't been reopened to this player"
+            assert self.min_raise_to() <= raise_to <= self.max_raise_to(), "illegal raise amount"
+            # a raise smaller than the minimum (only possible all in) doesn't
+            # change the minimum, nor let players who have acted raise again
+            if raise_to - self.current_bet >= self.min_raise:
+                self.min_raise = raise_to - self.current_bet
+            self.current_bet = raise_to
+            amount = self._put(seat, raise_to - self.bets[seat])
+            # everyone else still able to act gets to respond
+            self._to_act = self._num_actors - (1 if self.stacks[seat] else 0) + 1
+        else:
+            raise ValueError(f"unknown action {action}")
+
+        self._matched[seat] = self.current_bet
+        self.actions.append((seat, action, raise_to if action == RAISE else amount, self.street))
+        self._to_act -= 1
+        self._advance()
+
+    def _advance(self, moved=True):
+        if self._num_in_hand == 1:
+            self._finish([self.folded.index(False)], showdown=False)
+            return
+
+        actors = self._num_actors
+        betting_over = self._to_act <= 0 or not actors
+        if actors == 1 and not betting_over:
+            # the last player with chips only has to act if they're facing a bet
+            seat = self.turn if self._can_act(self.turn) else self._next_seat(self.turn)
+            betting_over = self.bets[seat] >= self.current_bet
+
+        if not betting_over:
+            if moved or not self._can_act(self.turn):
+                self.turn = self._next_seat(self.turn)
+            return
+
+        in_hand = [seat for seat in range(self.num_seats) if not self.folded[seat]]
+        if self.street == RIVER or actors <= 1:
+            # nobody left to bet against: run out the rest of the board
+            while len(self.board) < TABLE_SIZE:
+                self._deal_street()
+            self._showdown(in_hand)
+            return
+
+        self._deal_street()
+        self.bets = [0] * self.num_seats
+        self.current_bet = 0
+        self.min_raise = self.big_blind
+        self._start_betting(1 % self.num_seats)
+
+    def _deal_street(self):
+        for _ in range(FLOP_SIZE if not self.board else 1):
+            card = self._runout[len(self.board)] if self._runout else self.deck.deal()
+            self.board.append(card)
+            self._board_mask |= card.mask
+        self.street = min(self.street + 1, RIVER)
+
+    def _showdown(self, in_hand):
+        self.strengths = [None] * self.num_seats
+        for seat in in_hand:
+            self.strengths[seat] = self.hand_strength(seat)
+        self._finish(in_hand, showdown=True)
+
+    def _finish(self, in_hand, showdown):
+        self.winnings = [0] * self.num_seats
+        self.refunds = [0] * self.num_seats
+
+        # whatever the biggest bettor put in above everyone else goes back to them
+        committed = list(self.committed)
+        top = max(range(self.num_seats), key=lambda seat: committed[seat])
+        self.refunds[top] = committed[top] - max(c for seat, c in enumerate(committed) if seat != top)
+        committed[top] -= self.refunds[top]
+
+        # side pots: each level of commitment is contested by those who reached it.
+        # the last pot also takes the chips of folded seats that got past it
+        levels = sorted(set(committed[seat] for seat in in_hand))
+        previous = 0
+        for i, level in enumerate(levels):
+            cap = level if i < len(levels) - 1 else max(committed)
+            pot = sum(min(c, cap) - min(c, previous) for c in committed)
+            eligible = [seat for seat in in_hand if committed[seat] >= level]
+            if showdown:
+                best = max(self.strengths[seat] for seat in eligible)
+                eligible = [seat for seat in eligible if self.strengths[seat] == best]
+
+            # odd chips go to the first winners after the dealer
+            share, odd = divmod(pot, len(eligible))
+            for j, seat in enumerate(sorted(eligible, key=lambda s: (s - 1) % self.num_seats)):
+                self.winnings[seat] += share + (1 if j < odd else 0)
+            previous = level
+
+        for seat in range(self.num_seats):
+            self.stacks[seat] += self.winnings[seat] + self.refunds[seat]
+
+        self.finished = True
+        self.turn = -1
+
+    # the strength of seat's best hand with the board dealt so far
+    def hand_strength(self, seat):
+        return evaluate_mask(self._hole_masks[seat] | self._board_mask)
+
+    # the seats awarded (part of) a pot; getting an uncalled bet back isn't winning
+    def winners(self):
+        return [seat for seat in range(self.num_seats) if self.winnings and
+                self.winnings[seat] > 0 and not self.folded[seat]]
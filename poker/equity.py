@@ -0,0 +1,155 @@
+# monte carlo win/tie equity for known hole cards against each other.
+# runouts are sampled in batches on a process pool and evaluated with the
+# batch evaluator; sampling stops as soon as every player's equity estimate
+# reaches the target standard error
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from poker.batch import evaluate_batch
+from poker.cards import CARDS_IN_DECK
+
+BOARD_SIZE = 5
+
+DEFAULT_TARGET_STD_ERR = 0.005
+DEFAULT_MAX_SAMPLES = 400_000
+# runouts sampled by a single task
+DEFAULT_BATCH_SIZE = 10_000
+Z_95 = 1.96
+
+# worker count -> shared pool of that many processes
+_pools = {}
+
+
+def pool_size(workers=None):
+    return workers or os.cpu_count()
+
+
+# a pool of workers processes (one per cpu by default), started once and shared
+def get_pool(workers=None):
+    workers = pool_size(workers)
+    pool = _pools.get(workers)
+    if pool is None:
+        pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+    return pool
+
+
+def shutdown_pool():
+    for pool in _pools.values():
+        pool.shutdown()
+    _pools.clear()
+
+
+class EquityResult:
+    def __init__(self, wins, ties, shares, samples, exact=False):
+        self.samples = samples
+        self.exact = exact
+        self.win = [w / samples for w in wins]
+        self.tie = [t / samples for t in ties]
+        # win plus this player's share of every tie
+        self.equity = [s / samples for s in shares]
+
+    def std_err(self, i):
+        if self.exact:
+            return 0.0
+        p = self.equity[i]
+        return math.sqrt(max(p * (1 - p), 0.0) / self.samples)
+
+    def max_std_err(self):
+        return max(self.std_err(i) for i in range(len(self.equity)))
+
+    # confidence interval for player i's equity (95% by default)
+    def interval(self, i, z=Z_95):
+        err = z * self.std_err(i)
+        return max(self.equity[i] - err, 0.0), min(self.equity[i] + err, 1.0)
+
+
+# strengths is (players, runouts); returns per-player win and tie counts and
+# pot shares, where a tie between k players is worth 1/k to each of them
+def outcomes(strengths, weights=None):
+    is_best = strengths == strengths.max(axis=0)
+    num_best = is_best.sum(axis=0)
+
+    wins = is_best & (num_best == 1)
+    ties = is_best & (num_best > 1)
+    shares = is_best / num_best
+
+    if weights is None:
+        return wins.sum(axis=1), ties.sum(axis=1), shares.sum(axis=1)
+    return wins @ weights, ties @ weights, shares @ weights
+
+
+def showdown_strengths(hole, boards):
+    strengths = np.empty((len(hole), len(boards)), dtype=np.int32)
+    for i, cards in enumerate(hole):
+        hand = np.broadcast_to(np.asarray(cards, dtype=np.int8), (len(boards), len(cards)))
+        strengths[i] = evaluate_batch(np.hstack([hand, boards]))[0]
+    return strengths
+
+
+def _sample(hole, board, remaining, samples, seed):
+    rng = np.random.default_rng(seed)
+    needed = BOARD_SIZE - len(board)
+
+    # the `needed` smallest of a row of random keys pick a uniform runout
+    keys = rng.random((samples, len(remaining)))
+    draws = np.argpartition(keys, needed - 1, axis=1)[:, :needed]
+    runouts = np.asarray(remaining, dtype=np.int8)[draws]
+
+    known = np.broadcast_to(np.asarray(board, dtype=np.int8), (samples, len(board)))
+    return outcomes(showdown_strengths(hole, np.hstack([known, runouts])))
+
+
+# hands is a list of hole card lists, one per player still in the hand.
+# batches run on a shared pool of workers processes (one per cpu if None);
+# with workers=0 everything runs in this process, which is handy for small jobs.
+# wave_size tasks are submitted per round before checking the standard error,
+# one per worker (or one inline) if None; a seeded run gives the same answer
+# for the same wave size, so pass it too to reproduce a run on another machine
+def equity(hands, board=(), dead=(), target_std_err=DEFAULT_TARGET_STD_ERR,
+           max_samples=DEFAULT_MAX_SAMPLES, batch_size=DEFAULT_BATCH_SIZE,
+           wave_size=None, seed=None, workers=None):
+    hole = [[c.id for c in hand] for hand in hands]
+    board = [c.id for c in board]
+    known = [i for cards in hole for i in cards] + board + [c.id for c in dead]
+    assert len(set(known)) == len(known), "a card can't be in two places at once"
+    assert len(board) <= BOARD_SIZE, "can't have more than 5 cards on the table"
+
+    if len(board) == BOARD_SIZE:
+        strengths = showdown_strengths(hole, np.array([board], dtype=np.int8))
+        return EquityResult(*outcomes(strengths), samples=1, exact=True)
+
+    known = set(known)
+    remaining = [i for i in range(CARDS_IN_DECK) if i not in known]
+    streams = np.random.SeedSequence(seed)
+    pool = get_pool(workers) if workers != 0 else None
+    if wave_size is None:
+        wave_size = pool_size(workers) if pool is not None else 1
+
+    wins = np.zeros(len(hole))
+    ties = np.zeros(len(hole))
+    shares = np.zeros(len(hole))
+    samples = 0
+    result = None
+
+    while samples < max_samples:
+        seeds = streams.spawn(wave_size)
+        if pool is not None:
+            batches = [f.result() for f in [pool.submit(_sample, hole, board, remaining, batch_size, s)
+                                            for s in seeds]]
+        else:
+            batches = [_sample(hole, board, remaining, batch_size, s) for s in seeds]
+
+        for w, t, s in batches:
+            wins += w
+            ties += t
+            shares += s
+        samples += batch_size * wave_size
+
+        result = EquityResult(wins.tolist(), ties.tolist(), shares.tolist(), samples)
+        if result.max_std_err() <= target_std_err:
+            break
+
+    return result
@@ -0,0 +1,82 @@
+# routes reaction and message events straight to the game coroutine waiting
+# for them. client.wait_for runs every pending check against every event, so
+# its cost grows with the number of games; here each event is one dict lookup
+import asyncio
+
+
+class EventRouter:
+    def __init__(self):
+        # (message id, user id) -> (accepted emojis, future)
+        self._reactions = {}
+        # (channel id, user id) -> (check, future)
+        self._messages = {}
+        # message id -> object with on_reaction_add/on_reaction_remove, for
+        # messages anyone can react to (e.g. a lobby)
+        self._listeners = {}
+
+    def listen(self, message_id, listener):
+        self._listeners[message_id] = listener
+
+    def unlisten(self, message_id):
+        self._listeners.pop(message_id, None)
+
+    async def _wait(self, waiters, key, entry, timeout):
+        waiters[key] = entry
+        try:
+            return await asyncio.wait_for(entry[1], timeout)
+        finally:
+            if waiters.get(key) is entry:
+                del waiters[key]
+
+    # waits for user_id to react to message_id with one of emojis, and returns
+    # the emoji. raises asyncio.TimeoutError after timeout seconds
+    async def wait_for_reaction(self, message_id, user_id, emojis, timeout=None):
+        future = asyncio.get_event_loop().create_future()
+        return await self._wait(self._reactions, (message_id, user_id), (emojis, future), timeout)
+
+    # waits for a message from user_id in channel_id that passes check
+    async def wait_for_message(self, channel_id, user_id, check=lambda m: True, timeout=None):
+        future = asyncio.get_event_loop().create_future()
+        return await self._wait(self._messages, (channel_id, user_id), (check, future), timeout)
+
+    # the dispatchers return whether the event was consumed by a waiting game or listener
+    def dispatch_reaction(self, payload):
+        listener = self._listeners.get(payload.message_id)
+        if listener is not None:
+            listener.on_reaction_add(payload)
+            return True
+
+        entry = self._reactions.get((payload.message_id, payload.user_id))
+        if entry is None:
+            return False
+
+        emojis, future = entry
+        emoji = str(payload.emoji)
+        if emoji not in emojis or future.done():
+            return False
+
+        future.set_result(emoji)
+        return True
+
+    def dispatch_reaction_remove(self, payload):
+        listener = self._listeners.get(payload.message_id)
+        if listener is None:
+            return False
+
+        listener.on_reaction_remove(payload)
+        return True
+
+    def dispatch_message(self, message):
+        entry = self._messages.get((message.channel.id, message.author.id))
+        if entry is None:
+            return False
+
+        check, future = entry
+        if future.done() or not check(message):
+            return False
+
+        future.set_result(message)
+        return True
+
+    def __len__(self):
+        return len(self._reactions) + len(self._messages) + len(self._listeners)
@@ -0,0 +1,201 @@
+# the 22,100 flops fall into 1,755 classes that differ only by a relabelling
+# of suits; every hand does the same on flops of one class (with its hole cards
+# relabelled the same way). per flop work can be done once per class and
+# weighted by the class's count instead.
+#
+# the index is generated once (python -m poker.flops) into a small versioned
+# binary file and memory-mapped, like the preflop table. it needs nothing but
+# the standard library, so anything can load it. a flop's position in the file
+# is its combinatorial index, so looking one up is a couple of reads.
+#
+# file layout (little endian):
+#   header:  magic b"PKFL", version (u16), flops (u16), classes (u16),
+#            padding (u16), crc32 of the payload (u32)
+#   payload: the class of every flop (u16 each, by flop index), then the suit
+#            permutation taking it to its class's canonical flop (u8 each, an
+#            index into PERMUTATIONS), then for each class its canonical card
+#            ids (3 u8), pairing, suits, connectedness and high card (u8 each)
+#            and how many flops are in it (u16)
+import argparse
+import mmap
+import os
+import struct
+import zlib
+from itertools import combinations, permutations
+
+from poker.cards import NUM_RANKS, NUM_SUITS, CARDS_IN_DECK, binomial
+
+MAGIC = b"PKFL"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHHI")
+FLOP = struct.Struct("<H")
+PERM = struct.Struct("<B")
+CLASS = struct.Struct("<3BBBBBH")
+NUM_FLOPS = binomial(CARDS_IN_DECK, 3)
+NUM_CLASSES = 1755
+
+# every relabelling of suits; PERMUTATIONS[i][suit] is where suit goes
+PERMUTATIONS = tuple(permutations(range(NUM_SUITS)))
+
+DEFAULT_PATH = os.environ.get("FLOP_INDEX_PATH", os.path.join(os.path.dirname(__file__), "data", "flops.bin"))
+
+# pairing
+UNPAIRED, PAIRED, TRIPS = range(3)
+STRAIGHT_SIZE = 5
+
+
+# the flop's position among all flops: the combinatorial number system on its sorted card ids
+def flop_index(ids):
+    a, b, c = sorted(ids)
+    return a + b * (b - 1) // 2 + c * (c - 1) * (c - 2) // 6
+
+
+def relabel(card_id, perm):
+    return perm[card_id // NUM_RANKS] * NUM_RANKS + card_id % NUM_RANKS
+
+
+def _high_rank(card_id):
+    # the Rank enum puts the ace first
+    return (card_id % NUM_RANKS - 1) % NUM_RANKS
+
+
+# how many straights two hole cards could make with the flop: the five rank
+# windows (the wheel included) holding every flop rank. 0 on a paired flop
+def connectedness(ids):
+    ranks = {_high_rank(i) for i in ids}
+    if len(ranks) < len(ids):
+        return 0
+    # the lowest straight tops out at a five and wraps round to the ace
+    return sum(ranks <= {(top - i) % NUM_RANKS for i in range(STRAIGHT_SIZE)}
+               for top in range(STRAIGHT_SIZE - 2, NUM_RANKS))
+
+
+class FlopClass:
+    __slots__ = ("index", "cards", "pairing", "suits", "connectedness", "high_card", "count")
+
+    def __init__(self, index, cards, pairing, suits, connectedness, high_card, count):
+        self.index = index
+        # card ids of the canonical flop, lowest first
+        self.cards = cards
+        self.pairing = pairing
+        # how many suits are on the flop
+        self.suits = suits
+        self.connectedness = connectedness
+        # ace high rank (0 is a two, 12 an ace)
+        self.high_card = high_card
+        # flops in the class
+        self.count = count
+
+    @property
+    def paired(self):
+        return self.pairing != UNPAIRED
+
+    @property
+    def monotone(self):
+        return self.suits == 1
+
+    @property
+    def two_tone(self):
+        return self.suits == 2
+
+    @property
+    def rainbow(self):
+        return self.suits == 3
+
+    def __repr__(self):
+        return f"FlopClass({self.index}, cards={self.cards}, count={self.count})"
+
+
+class FlopIndex:
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, flops, classes, _, checksum = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} flop index")
+        if (flops, classes) != (NUM_FLOPS, NUM_CLASSES):
+            raise ValueError(f"{path} has the wrong shape")
+
+        payload = memoryview(self._mmap)[HEADER.size:]
+        if zlib.crc32(payload) != checksum:
+            raise ValueError(f"{path} failed its checksum; regenerate it")
+
+        # raw little endian u16s and u8s by flop index, for np.frombuffer(..., "<u2") and the like
+        self.class_ids = payload[:NUM_FLOPS * FLOP.size]
+        self.perms = payload[NUM_FLOPS * FLOP.size:NUM_FLOPS * (FLOP.size + PERM.size)]
+        self.classes = tuple(FlopClass(i, record[:3], *record[3:]) for i, record in
+                             enumerate(CLASS.iter_unpack(payload[NUM_FLOPS * (FLOP.size + PERM.size):])))
+
+    # (class, suit permutation) of a flop given as three card ids; relabelling
+    # the flop's suits (and any hole cards) by the permutation gives the class's cards
+    def lookup(self, ids):
+        index = flop_index(ids)
+        return self.classes[FLOP.unpack_from(self.class_ids, index * FLOP.size)[0]], \
+            PERMUTATIONS[self.perms[index]]
+
+    def classify(self, cards):
+        return self.lookup([c.id for c in cards])
+
+    def __len__(self):
+        return len(self.classes)
+
+
+_index = None
+
+
+# the shared index, or None if it hasn't been generated
+def get_flop_index():
+    global _index
+    if _index is None and os.path.exists(DEFAULT_PATH):
+        _index = FlopIndex(DEFAULT_PATH)
+    return _index
+
+
+# (class of every flop, permutation of every flop, class records), by brute
+# force: a flop's canonical form is its smallest relabelling
+def build():
+    class_of = {}
+    records = []
+    class_ids = [0] * NUM_FLOPS
+    perms = [0] * NUM_FLOPS
+
+    for flop in combinations(range(CARDS_IN_DECK), 3):
+        relabelled = [tuple(sorted(relabel(i, perm) for i in flop)) for perm in PERMUTATIONS]
+        canonical = min(relabelled)
+        if canonical not in class_of:
+            ranks = {_high_rank(i) for i in canonical}
+            class_of[canonical] = len(records)
+            records.append([*canonical, len(canonical) - len(ranks), len({i // NUM_RANKS for i in canonical}),
+                            connectedness(canonical), max(ranks), 0])
+
+        index = flop_index(flop)
+        class_ids[index] = class_of[canonical]
+        perms[index] = relabelled.index(canonical)
+        records[class_ids[index]][-1] += 1
+
+    return class_ids, perms, records
+
+
+def generate(path=DEFAULT_PATH):
+    class_ids, perms, records = build()
+    assert len(records) == NUM_CLASSES, "wrong number of flop classes"
+
+    payload = struct.pack(f"<{NUM_FLOPS}H", *class_ids) + bytes(perms) + \
+        b"".join(CLASS.pack(*record) for record in records)
+    header = HEADER.pack(MAGIC, VERSION, NUM_FLOPS, NUM_CLASSES, 0, zlib.crc32(payload))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # write to a temporary file first so readers never map a half-written index
+    with open(path + ".tmp", "wb") as f:
+        f.write(header + payload)
+    os.replace(path + ".tmp", path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the flop index.")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    generate(args.path)
+    print(f"Wrote {args.path}")
@@ -1,23 +1,45 @@
+import asyncio
 import discord
+import json
 import os
-from random import shuffle
+import random
+import time
 from datetime import datetime
 from typing import List
 from enum import Enum
 
 from helpers import english_list
-from poker.cards import Deck
+from poker.cards import Deck, CARDS, CARDS_IN_DECK, cards_to_mask
+from poker.compute import get_compute
+from poker.engine import HandState, PLAYER_HAND_SIZE, FLOP_SIZE, TABLE_SIZE, SMALL_BLIND, BIG_BLIND, RAISE, \
+    STREET_NAMES
+from poker.equity import equity
+from poker.events import EventRouter
+from poker.history import HandHistory, Entry, new_history_path, GAME, HAND, BLIND, ACTION, REVEAL, TIMEOUT, \
+    RESULT
+from poker.preflop import get_preflop_table, MAX_OPPONENTS
+from poker.runouts import Runouts
 from poker.hands import detect_hand
+from poker.messages import MessageRegistry
+from poker.outs import find_outs
+from poker.metrics import METRICS, COUNT_BUCKETS, timed
 
 EMOJIS_LOADED = False
 # server that has card emojis
 EMOJI_SERVER_ID = int(os.environ.get("EMOJI_SERVER_ID"))
 EMOJIS = []
+# rendered emojis from the last time the emoji server was seen, so a restarted
+# bot can render cards before its guild cache is populated
+EMOJI_SNAPSHOT_PATH = os.environ.get("EMOJI_SNAPSHOT_PATH", "emoji_snapshot.json")
+
+# CARD_TOPS[card.id] and CARD_BOTTOMS[card.id] are the two rendered halves of a card
+CARD_TOPS = ["None"] * CARDS_IN_DECK
+CARD_BOTTOMS = ["None"] * CARDS_IN_DECK
+BLANK_TOP = BLANK_BOTTOM = "None"
 
-PLAYER_HAND_SIZE = 2
-FLOP_SIZE = 3
-TABLE_SIZE = 5
 EMBED_COLOR = 0x277714
+# seconds a player has to act before they are folded
+TURN_TIMEOUT = 60
 
 CHECK_EMOJI = ":white_check_mark:"
 CALL_EMOJI = ":cl:"
@@ -29,6 +51,9 @@ CALL_EMOJI_RAW = "🆑"
 RAISE_EMOJI_RAW = "⬆️"
 FOLD_EMOJI_RAW = "🚫"
 
+LOG_BACK_EMOJI_RAW = "⬅️"
+LOG_FORWARD_EMOJI_RAW = "➡️"
+
 DEALER_EMOJI = ":radio_button:"
 BIG_BLIND_EMOJI = ":moneybag:"
 SMALL_BLIND_EMOJI = ":dollar:"
@@ -46,22 +71,8 @@ class TurnTypes(Enum):
     def emoji(self):
         return [CHECK_EMOJI, CALL_EMOJI, RAISE_EMOJI, FOLD_EMOJI][self.value]
 
-
-class LogEntry:
-    def __init__(self, arg1, turn_type=None, raise_amount=0):
-        self.arg1 = arg1 # player, or manual log entry string
-        self.player = arg1
-        self.turn_type = turn_type
-        self.raise_amount = raise_amount
-
-    def __str__(self):
-        if isinstance(self.arg1, str):
-            return self.arg1
-
-        s = self.player.mention + " " + str(self.turn_type)
-        if self.turn_type == TurnTypes.RAISE:
-            s += " to " + str(self.raise_amount)
-        return s + "."
+    def raw_emoji(self):
+        return [CHECK_EMOJI_RAW, CALL_EMOJI_RAW, RAISE_EMOJI_RAW, FOLD_EMOJI_RAW][self.value]
 
 
 class PlayerTypes(Enum):
@@ -77,12 +88,18 @@ def load_emojis(client):
         return
 
     card_server = client.get_guild(EMOJI_SERVER_ID)
+    if card_server is None:
+        # not cached yet; keep rendering from the snapshot until it is
+        return
+
     EMOJIS = card_server.emojis
+    build_render_index(EMOJIS)
+    save_render_snapshot()
 
     EMOJIS_LOADED = True
 
 
-def card_to_emojis(card):
+def card_emoji_names(card):
     suit1 = "b" if card.suit.name[0] in "SC" else "r"
     suit2 = card.suit.name.lower()
     rank_num = card.rank.value + 1
@@ -93,27 +110,68 @@ def card_to_emojis(card):
     else:
         rank = str(rank_num)
 
-    emoji1 = discord.utils.get(EMOJIS, name=suit1 + rank)
-    emoji2 = discord.utils.get(EMOJIS, name="e" + suit2)
+    return suit1 + rank, "e" + suit2
 
-    return emoji1, emoji2
 
+def build_render_index(emojis):
+    global BLANK_TOP, BLANK_BOTTOM
+    # reversed so the first emoji with a name wins, like discord.utils.get
+    by_name = {emoji.name: emoji for emoji in reversed(emojis)}
 
-def emojis_to_str(ems, join=" ", sep="\n"):
-    top = btm = ""
+    for card in CARDS:
+        top, bottom = card_emoji_names(card)
+        CARD_TOPS[card.id] = str(by_name.get(top))
+        CARD_BOTTOMS[card.id] = str(by_name.get(bottom))
 
-    for up, down in ems:
-        top += str(up) + join
-        btm += str(down) + join
+    BLANK_TOP = str(by_name.get("blankbacktop"))
+    BLANK_BOTTOM = str(by_name.get("blankbackbot"))
 
-    return top + sep + btm
+
+def save_render_snapshot():
+    try:
+        with open(EMOJI_SNAPSHOT_PATH, "w") as f:
+            json.dump({"tops": CARD_TOPS, "bottoms": CARD_BOTTOMS, "blank": [BLANK_TOP, BLANK_BOTTOM]}, f)
+    except OSError as e:
+        print(f"Couldn't save emoji snapshot: {e}")
+
+
+def load_render_snapshot():
+    global BLANK_TOP, BLANK_BOTTOM
+    try:
+        with open(EMOJI_SNAPSHOT_PATH) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+
+    CARD_TOPS[:] = snapshot["tops"]
+    CARD_BOTTOMS[:] = snapshot["bottoms"]
+    BLANK_TOP, BLANK_BOTTOM = snapshot["blank"]
+
+
+load_render_snapshot()
 
 
 def cards_to_str(cards, join=" ", sep="\n", blanks=0):
-    blank_top = discord.utils.get(EMOJIS, name="blankbacktop")
-    blank_btm = discord.utils.get(EMOJIS, name="blankbackbot")
-    emojis = [card_to_emojis(c) for c in cards] + [(blank_top, blank_btm)] * blanks
-    return emojis_to_str(emojis, join, sep)
+    tops = [CARD_TOPS[c.id] for c in cards] + [BLANK_TOP] * blanks
+    bottoms = [CARD_BOTTOMS[c.id] for c in cards] + [BLANK_BOTTOM] * blanks
+    return "".join(t + join for t in tops) + sep + "".join(b + join for b in bottoms)
+
+
+def _embed_template():
+    # generated with https://discohook.org/ and https://leovoel.github.io/embed-visualizer/
+    embed = discord.Embed(colour=discord.Colour(EMBED_COLOR),
+                          description="Welcome to Poker! In this window, you'll be able to see the "
+                                      "cards on the table and in your hand, the turn order, and "
+                                      "the action log. Good luck!")
+    embed.set_author(name="Poker Game Alpha",
+                     icon_url="https://cdn.discordapp.com/avatars/734515824051617813/"
+                              "4cb69fdb5cc46c88b81aaecf44703b0f.png?size=256")
+    embed.set_footer(text="Last updated")
+    return embed.to_dict()
+
+
+# the parts of the embed that never change; fields and the timestamp are added per update
+EMBED_TEMPLATE = _embed_template()
 
 
 """
@@ -123,12 +181,10 @@ raising works like this:
     and only increment by minimum allowed amount
 """
 # TODO: organize functions into files
-# TODO: calculate winner
 # TODO: new raise interface (described above)
 # TODO: negative betting fix
 # TODO: log scrolling
 # TODO: game customization (minimum bet, initial balance)
-# TODO: intergame balance storing
 # TODO: all in
 
 
@@ -138,228 +194,391 @@ class Player:
         self.user = user
         self.type = PlayerTypes.NORMAL
         self.hand = hand
-        self.message_id = -1
+        # handles to this player's live messages; embed is their game window
+        self.messages = MessageRegistry(game.count_api)
+        self.embed = None
+        # the embed fields this player was last sent
+        self.view = None
+        # the log page this player has scrolled to, or None to follow the game
+        self.log_page = None
         self.balance = balance
         self.mention = user.mention
         self.folded = False
 
     async def send(self, *args, **kwargs):
+        self.game.count_api("send")
         return await self.user.send(*args, **kwargs)
 
+    # sends a message that will be edited or deleted later, and returns its handle
+    async def send_tracked(self, *args, **kwargs):
+        message = await self.send(*args, **kwargs)
+        return self.messages.add(message)
+
+    def untrack(self, handle):
+        self.messages.remove(handle.id)
+
+    # the scroll reactions on the embed. a bot can't remove reactions in dms,
+    # so removing an arrow scrolls just like adding one
+    def on_reaction_add(self, payload):
+        if payload.user_id != self.user.id:
+            return
+
+        emoji = str(payload.emoji)
+        last = self.game.history.num_pages - 1
+        page = last if self.log_page is None else self.log_page
+        if emoji == LOG_BACK_EMOJI_RAW:
+            page = max(page - 1, 0)
+        elif emoji == LOG_FORWARD_EMOJI_RAW:
+            page = min(page + 1, last)
+        else:
+            return
+
+        self.log_page = None if page == last else page
+        asyncio.ensure_future(self.game.send_embed())
+
+    on_reaction_remove = on_reaction_add
+
 
 class Game:
-    def __init__(self, players: List[discord.User], client: discord.Client, init_bal=1000):
+    # balances (user id -> chips) overrides init_bal for the players in it. with
+    # a bank, the chips each player wins or loses are committed after every hand.
+    # every shuffle comes from seed (a random one by default). it gives away
+    # every card, so it's only written to the history once the game is over,
+    # and the game can then be replayed from it
+    def __init__(self, players: List[discord.User], client: discord.Client, router: EventRouter, init_bal=1000,
+                 small_blind=SMALL_BLIND, big_blind=BIG_BLIND, bank=None, guild_id=None, balances=None,
+                 compute=None, seed=None):
         self.client = client
-        self.players = [Player(self, player, [], init_bal) for player in players]
-        self.deck = Deck().shuffle()
+        self.router = router
+        balances = balances or {}
+        self.players = [Player(self, player, [], balances.get(player.id, init_bal)) for player in players]
+        self.bank = bank
+        self.guild_id = guild_id
+        self.small_blind = small_blind
+        self.big_blind = big_blind
+        self.seed = seed if seed is not None else random.SystemRandom().getrandbits(63)
+        self.rng = random.Random(self.seed)
+        self.deck = Deck(self.rng)
         self.table = []
         self.turn_order = self.players[:]
         self.active = True
-        self.action_log = []
-        shuffle(self.turn_order)
+        # called with the game when it ends
+        self.on_finish = []
+        self.history = HandHistory(new_history_path())
+        self.hand_number = 0
+        # the turn and pot the embeds were last sent with
+        self.shown = (0, 0)
+        self._render_lock = asyncio.Lock()
+        # discord api calls made this hand, by kind
+        self.api_calls = {}
+        self.equity = {}
+        self.runouts = None
+        # player -> Outs, on the flop and turn
+        self.outs = {}
+        self.runout_players = []
+        # evaluation and equity run here rather than on the event loop
+        self.compute = compute or get_compute()
+        # what the equity being computed is for, so a late result for old cards is dropped
+        self.equity_key = None
+        self.rng.shuffle(self.turn_order)
         load_emojis(client)
 
     def reshuffle(self):
-        self.deck = Deck().shuffle()
+        self.deck.shuffle()
 
     async def deal_to_all(self):
-        for player in self.players:
-            cards = [self.deck.deal() for _ in range(PLAYER_HAND_SIZE)]
+        hands, _ = self.deck.deal_many(len(self.players), PLAYER_HAND_SIZE)
+        for player, cards in zip(self.players, hands):
             player.hand = cards
 
-    async def send_embed(self, turn=0, pot=0):
-        # generated with https://discohook.org/ and https://leovoel.github.io/embed-visualizer/
-        for player in self.players:
-            embed = discord.Embed(colour=discord.Colour(EMBED_COLOR),
-                                  description="Welcome to Poker! In this window, you'll be able to see the "
-                                              "cards on the table and in your hand, the turn order, and "
-                                              "the action log. Good luck!",
-                                  timestamp=datetime.utcnow())
-
-            embed.set_author(name="Poker Game Alpha",
-                             icon_url="https://cdn.discordapp.com/avatars/734515824051617813/"
-                                      "4cb69fdb5cc46c88b81aaecf44703b0f.png?size=256")
-            embed.set_footer(text="Last updated")
-
-            blanks = 5 - len(self.table)
-            embed.add_field(name="On the Table",
-                            value=cards_to_str(self.table, blanks=blanks) + f"\nPot: {pot}", inline=True)
-            embed.add_field(name="In Your Hand",
-                            value=cards_to_str(player.hand) + f"\nBalance: {player.balance}", inline=True)
-
-            hand_type, cards = detect_hand(self.table + player.hand)
-            embed.add_field(name=f"You have a {hand_type.real_name()}:", value=cards_to_str(cards), inline=True)
-
-            max_logs = 4
-            log = "\n".join(map(str, self.action_log[-max_logs:])) if self.action_log else "Nothing here yet..."
-            log += f"\nPage {len(self.action_log) // max_logs} / {len(self.action_log) // max_logs}\n\n" \
-                   f"React with :arrow_left: and :arrow_right: to scroll."
-            # TODO
-
-            embed.add_field(name="Log", value=log, inline=True)
-
-            turn_str = ""
-            for i, p in enumerate(self.turn_order):
-                turn_emoji = TURN_EMOJI if i == turn else NORMAL_EMOJI
-                mention = "~~" + p.mention + "~~" if p.folded else p.mention
-                turn_str += f"{turn_emoji} {mention} {p.type.emoji()}\n"
-
-            embed.add_field(name="Turn Order",
-                            value=turn_str + f"\n{TURN_EMOJI} = current turn\n{DEALER_EMOJI} = dealer\n"
-                                             f"{BIG_BLIND_EMOJI} = big blind\n{SMALL_BLIND_EMOJI} = small blind",
-                            inline=True)
-
-            if player.message_id == -1:
-                msg = await player.send(embed=embed)
-                player.message_id = msg.id
+    def log_field(self, page):
+        entries = self.history.page(page)
+        log = "\n".join(map(str, entries)) if entries else "Nothing here yet..."
+        log += f"\nPage {page + 1} / {self.history.num_pages}\n\n" \
+               f"React with :arrow_left: and :arrow_right: to scroll."
+        return "Log", log
+
+    def count_api(self, kind):
+        self.api_calls[kind] = self.api_calls.get(kind, 0) + 1
+        METRICS.inc("discord_api_calls_total", kind=kind)
+
+    # sends everyone their window, or edits it. with no turn and pot it's
+    # re-rendered as last shown (e.g. after a scroll). renders wait for each
+    # other, so an older one can't land after a newer one or send a second window
+    async def send_embed(self, turn=None, pot=None):
+        async with self._render_lock:
+            if turn is None:
+                turn, pot = self.shown
+            await self._render(turn, pot)
+
+    @timed("game_phase_seconds", phase="send_embed")
+    async def _render(self, turn, pot):
+        self.shown = (turn, pot)
+        # fields that are the same for everyone
+        blanks = 5 - len(self.table)
+        table_field = ("On the Table", cards_to_str(self.table, blanks=blanks) + f"\nPot: {pot}")
+
+        log_field = self.log_field(self.history.num_pages - 1)
+
+        turn_str = ""
+        for i, p in enumerate(self.turn_order):
+            turn_emoji = TURN_EMOJI if i == turn else NORMAL_EMOJI
+            mention = "~~" + p.mention + "~~" if p.folded else p.mention
+            turn_str += f"{turn_emoji} {mention} {p.type.emoji()}\n"
+
+        turn_field = ("Turn Order", turn_str + f"\n{TURN_EMOJI} = current turn\n{DEALER_EMOJI} = dealer\n"
+                                               f"{BIG_BLIND_EMOJI} = big blind\n{SMALL_BLIND_EMOJI} = small blind")
+
+        preflop = get_preflop_table()
+
+        # microseconds each (and mostly cached), so done here rather than on compute
+        detected = [detect_hand(self.table + player.hand) for player in self.players]
+
+        for player, hand in zip(self.players, detected):
+            hand_str = cards_to_str(player.hand) + f"\nBalance: {player.balance}"
+            if player in self.equity:
+                win, tie = self.equity[player]
+                hand_str += f"\nEquity: {win:.1%} win, {tie:.1%} tie"
+            if player in self.outs:
+                hand_str += "\n" + str(self.outs[player])
+
+            if preflop and not self.table:
+                opponents = min(len(self.players) - 1, MAX_OPPONENTS)
+                hand_str += f"\nVs. {opponents} random: {preflop.equity(player.hand, opponents):.1%}"
+
+            hand_type, cards = hand
+            fields = (table_field, ("In Your Hand", hand_str),
+                      (f"You have a {hand_type.real_name()}:", cards_to_str(cards)))
+            fields += (log_field if player.log_page is None else self.log_field(player.log_page), turn_field)
+
+            # nothing this player can see has changed, so don't spend an api call on it
+            if fields == player.view:
+                continue
+            player.view = fields
+
+            embed = discord.Embed.from_dict(EMBED_TEMPLATE)
+            embed.timestamp = datetime.utcnow()
+            for name, value in fields:
+                embed.add_field(name=name, value=value, inline=True)
+
+            if player.embed is None:
+                player.embed = await player.send_tracked(embed=embed)
+                self.router.listen(player.embed.id, player)
+                await player.embed.add_reaction(LOG_BACK_EMOJI_RAW)
+                await player.embed.add_reaction(LOG_FORWARD_EMOJI_RAW)
             else:
-                msg = discord.utils.get(self.client.cached_messages, id=player.message_id)
-                await msg.edit(embed=embed)
+                await player.embed.edit(embed=embed)
+
+    # a few hundred hands in one batch, so quick enough to do on the loop
+    def update_outs(self):
+        contenders = [p for p in self.players if not p.folded]
+        if len(contenders) < 2 or not FLOP_SIZE <= len(self.table) < TABLE_SIZE:
+            self.outs = {}
+            return
+        with METRICS.time("game_phase_seconds", phase="outs"):
+            self.outs = dict(zip(contenders, find_outs([p.hand for p in contenders], self.table)))
+
+    async def update_equity(self):
+        contenders = [p for p in self.players if not p.folded]
+        if len(contenders) < 2:
+            self.equity = {}
+            self.equity_key = None
+            return
+
+        hands = [p.hand for p in contenders]
+        if self.table and self.runouts and self.runout_players == contenders:
+            # same players as last street: narrowing down the runouts already evaluated is quick
+            self.set_equity(contenders, self.runouts.reveal(self.table[len(self.runouts.board):]))
+            return
+
+        key = (cards_to_mask(self.table), tuple(cards_to_mask(hand) for hand in hands))
+        self.equity_key = key
+        if not self.table:
+            # preflop: sample, enumerating every board would take too long multiway
+            job = ("equity", key), equity, hands, list(self.table)
+        else:
+            # the runouts are narrowed down street by street, so they can't be shared
+            job = ("runouts", key), Runouts, hands, list(self.table)
+
+        result = await self.compute.within(*job, cache=job[1] is equity)
+        if result is None:
+            # over budget: show the embed without equity, and fill it in when it arrives
+            self.equity = {}
+            self.compute.on_done(job[0], lambda late: self.late_equity(key, contenders, late))
+        else:
+            self.set_equity(contenders, result)
+
+    # result is an EquityResult, or a new Runouts to narrow down on later streets
+    def set_equity(self, contenders, result):
+        if isinstance(result, Runouts):
+            self.runouts = result
+            self.runout_players = contenders
+            result = result.result
+        self.equity = {p: (result.win[i], result.tie[i]) for i, p in enumerate(contenders)}
+
+    def late_equity(self, key, contenders, result):
+        if not self.active or key != self.equity_key:
+            return
+        self.set_equity(contenders, result)
+        asyncio.ensure_future(self.send_embed())
+
+    def finish(self):
+        if not self.active:
+            return
 
-    async def flip(self):
+        self.active = False
+        self.history.append(Entry(GAME, data=(self.seed,)))
+        self.history.close()
+        for player in self.players:
+            if player.embed is not None:
+                self.router.unlisten(player.embed.id)
+        for callback in self.on_finish:
+            callback(self)
+
+    # shows the next street of the engine's board, which may be several streets
+    # ahead when everyone left is all in
+    @timed("game_phase_seconds", phase="flip")
+    async def flip(self, board):
         assert len(self.table) < TABLE_SIZE, "can't show more than 5 cards"
 
         is_flop = (len(self.table) == 0)
         num_cards = FLOP_SIZE if is_flop else 1
+        revealed = board[len(self.table):len(self.table) + num_cards]
+        self.table.extend(revealed)
 
-        for _ in range(num_cards):
-            self.table.append(self.deck.deal())
+        # the street that starts with these cards
+        self.history.append(Entry(REVEAL, street=len(self.table) - FLOP_SIZE + 1,
+                                  data=tuple(card.id for card in revealed)))
+        self.update_outs()
+        await self.update_equity()
 
     async def send_to_all(self, msg, *but):
         for p in self.players:
             if p not in but:
                 await p.send(msg)
 
+    # prompts player for one of actions and returns (action, raise_to); a
+    # player who doesn't answer in time folds
+    async def ask_action(self, player, state, actions):
+        types = [TurnTypes(action) for action in actions]
+        temp_msg = await player.send_tracked("It is your turn! " + ", ".join(
+            f"{turn_type.emoji()} = {turn_type.name.lower()}" for turn_type in types))
+        for turn_type in types:
+            await temp_msg.add_reaction(turn_type.raw_emoji())
+
+        action, raise_to = TurnTypes.FOLD.value, 0
+        try:
+            emoji = await self.router.wait_for_reaction(temp_msg.id, player.user.id,
+                                                        [turn_type.raw_emoji() for turn_type in types],
+                                                        TURN_TIMEOUT)
+            action = next(turn_type.value for turn_type in types if turn_type.raw_emoji() == emoji)
+
+            if action == RAISE:
+                low, high = state.min_raise_to(), state.max_raise_to()
+                prompt = await player.send(f"How much would you like to raise to? ({low} to {high})")
+
+                def check(m):
+                    try:
+                        return low <= int(m.content) <= high
+                    except ValueError:
+                        return False
+
+                message = await self.router.wait_for_message(prompt.channel.id, player.user.id,
+                                                             check, TURN_TIMEOUT)
+                raise_to = int(message.content)
+
+        except asyncio.TimeoutError:
+            # an afk player folds rather than holding up the table
+            self.history.append(Entry(TIMEOUT, player.user.id, street=state.street))
+            action, raise_to = TurnTypes.FOLD.value, 0
+
+        await temp_msg.delete()
+        player.untrack(temp_msg)
+        return action, raise_to
+
     async def round(self):
-        pot = 0
-        bets = {player: 0 for player in self.players}
+        start = time.perf_counter()
+        state = HandState([player.balance for player in self.turn_order], self.deck,
+                          hole=[player.hand for player in self.turn_order],
+                          small_blind=self.small_blind, big_blind=self.big_blind)
 
         dealer = self.turn_order[0]
-        if len(self.turn_order) == 2:
-            first = 0
-            small_blind = self.turn_order[0]
-            big_blind = self.turn_order[1]
-        else:
-            first = 3
-            small_blind = self.turn_order[1]
-            big_blind = self.turn_order[2]
+        small_blind = self.turn_order[state.small_blind_seat]
+        big_blind = self.turn_order[state.big_blind_seat]
 
-        # TODO: constants
-        bets[small_blind] = 5
-        small_blind.balance -= 5
-        bets[big_blind] = 10
-        big_blind.balance -= 10
-
-        pot += 15
         dealer.type = PlayerTypes.DEALER
         small_blind.type = PlayerTypes.SMALL_BLIND
         big_blind.type = PlayerTypes.BIG_BLIND
 
-        self.action_log.append(LogEntry(f"{dealer.mention} deals."))
-        self.action_log.append(LogEntry(f"{big_blind.mention} places 10 as the big blind."))
-        self.action_log.append(LogEntry(f"{small_blind.mention} places 5 as the small blind."))
-
-        await self.send_embed(first, pot)
-
-        msgs = {}
-        for player in self.players:
-            msgs[player] = discord.utils.get(self.client.cached_messages, id=player.message_id)
-
-        pre_flop = True
-
-        while len(self.table) <= 5:
-            turn = first % len(self.turn_order)
-            player = self.turn_order[turn]
-            bets = bets if pre_flop else {player: 0 for player in self.players}
-            bet_now = bets[big_blind] if pre_flop else 0
-            # has_had_turn = {player: False for player in self.turn_order}
-            first_turn = True
-            last_raiser = player
-
-            await self.send_embed(turn, pot)
-
-            while last_raiser != player or first_turn:
-                if player.folded:
-                    turn += 1
-                    turn %= len(self.turn_order)
-                    player = self.turn_order[turn]
-                    await self.send_embed(turn, pot)
-                    continue
-
-                is_check = (bet_now == bets[player])
-
-                temp_msg = await player.send(f"It is your turn! {CHECK_EMOJI if is_check else CALL_EMOJI} = "
-                                             f"{'check' if is_check else 'call'}, "
-                                             f"{RAISE_EMOJI}️ = raise, {FOLD_EMOJI} = fold")
-                await temp_msg.add_reaction(CHECK_EMOJI_RAW if is_check else CALL_EMOJI_RAW)
-                await temp_msg.add_reaction(RAISE_EMOJI_RAW)
-                await temp_msg.add_reaction(FOLD_EMOJI_RAW)
-
-                def check(rxn, usr):
-                    return str(rxn.emoji) in [(CHECK_EMOJI_RAW if is_check else CALL_EMOJI_RAW),
-                                              RAISE_EMOJI_RAW, FOLD_EMOJI_RAW] \
-                           and rxn.message.id == temp_msg.id and usr.id == player.user.id
-
-                reaction, user = await self.client.wait_for('reaction_add', check=check)
-                emoji = str(reaction.emoji)
-
-                if emoji == FOLD_EMOJI_RAW:
-                    self.action_log.append(LogEntry(player, TurnTypes.FOLD))
-                    player.folded = True
-
-                elif emoji == CHECK_EMOJI_RAW:
-                    self.action_log.append(LogEntry(player, TurnTypes.CHECK))
-
-                elif emoji == CALL_EMOJI_RAW:
-                    change = bet_now - bets[player]
-                    player.balance -= change
-                    bets[player] = bet_now
-                    pot += change
-                    self.action_log.append(LogEntry(player, TurnTypes.CALL))
-
-                elif emoji == RAISE_EMOJI_RAW:
-                    await player.send("How much would you like to raise to?")
-
-                    def check(m):
-                        try:
-                            return int(m.content) >= bet_now + 10
-                        except ValueError:
-                            return False
-
-                    message = await self.client.wait_for('message', check=check)
-                    bet_now = int(message.content)
-                    change = bet_now - bets[player]
-                    bets[player] = bet_now
-                    pot += change
-                    last_raiser = player
-                    self.action_log.append(LogEntry(player, TurnTypes.RAISE, bet_now))
-
-                else:
-                    print("Something went wrong, no correct reactions")
-
-                await temp_msg.delete()
-                turn += 1
-                turn %= len(self.turn_order)
-                player = self.turn_order[turn]
-                first_turn = False
-                await self.send_embed(turn, pot)
-
-            if len(self.table) == 5:
-                break
-
-            await self.flip()
-
-            if pre_flop:
-                self.action_log.append(LogEntry(english_list(self.table[-3:]) + " revealed."))
+        self.hand_number += 1
+        seats = []
+        for player in self.turn_order:
+            seats += [player.user.id, player.balance]
+        self.history.append(Entry(HAND, dealer.user.id, len(self.turn_order), self.hand_number, data=tuple(seats)))
+        self.history.append(Entry(BLIND, small_blind.user.id, 0, state.committed[state.small_blind_seat]))
+        self.history.append(Entry(BLIND, big_blind.user.id, 1, state.committed[state.big_blind_seat]))
+
+        self.sync(state)
+        await self.update_equity()
+        await self.send_embed(state.turn, state.pot)
+        METRICS.observe("game_phase_seconds", time.perf_counter() - start, phase="blinds")
+
+        street, street_start = state.street, time.perf_counter()
+        while not state.finished:
+            player = self.turn_order[state.turn]
+            action, raise_to = await self.ask_action(player, state, state.legal_actions())
+            state.act(action, raise_to)
+
+            _, action, amount, street = state.actions[-1]
+            self.history.append(Entry(ACTION, player.user.id, action, amount, street))
+            self.sync(state)
+            if action == TurnTypes.FOLD.value:
+                self.update_outs()
+                await self.update_equity()
+
+            while len(self.table) < len(state.board):
+                await self.flip(state.board)
+
+            await self.send_embed(state.turn, state.pot)
+
+            if state.street != street or state.finished:
+                # a betting round is over (or the hand ended during it)
+                METRICS.observe("game_phase_seconds", time.perf_counter() - street_start, phase=STREET_NAMES[street])
+                street, street_start = state.street, time.perf_counter()
+
+        nets = [state.winnings[i] + state.refunds[i] - state.committed[i] for i in range(len(self.turn_order))]
+        for i, player in enumerate(self.turn_order):
+            showed_down = state.strengths is not None and state.strengths[i] is not None
+            self.history.append(Entry(RESULT, player.user.id, showed_down, state.winnings[i], data=(nets[i],)))
+        if self.bank:
+            # one write for the whole hand
+            await self.bank.commit_hand(self.guild_id, {player.user.id: nets[i]
+                                                        for i, player in enumerate(self.turn_order)})
+
+        contenders = [player for i, player in enumerate(self.turn_order) if not state.folded[i]]
+        winners = [self.turn_order[i] for i in state.winners()]
+        won = {self.turn_order[i]: state.winnings[i] for i in state.winners()}
+
+        if state.strengths is None:
+            # everyone else folded
+            await self.send_to_all(f"{winners[0].mention} wins the pot of {won[winners[0]]}!")
+        else:
+            hands = {player: detect_hand(player.hand + self.table) for player in contenders}
+            if len(winners) == 1:
+                won_str = f"{winners[0].mention} wins the pot of {won[winners[0]]}!"
             else:
-                self.action_log.append(LogEntry(str(self.table[-1]) + " revealed."))
+                won_str = english_list([f"{player.mention} wins {won[player]}" for player in winners]) + "!"
 
-            pre_flop = False
-            first = 1
-            await self.send_embed(turn, pot)
+            await self.send_to_all(english_list([player.mention + " has " + hands[player][0].real_name()
+                                                 for player in contenders]) + ". " + won_str)
 
-        hands = {player: detect_hand(player.hand + self.table) for player in self.turn_order}
+        for kind, calls in self.api_calls.items():
+            METRICS.observe("discord_api_calls_per_hand", calls, COUNT_BUCKETS, kind=kind)
+        self.api_calls = {}
+        self.finish()
 
-        await self.send_to_all(english_list([player.mention + " has " + hands[player][0].name
-                                             for player in self.turn_order]))
-        self.active = False
+    # copies the engine's chips and folds onto the players
+    def sync(self, state):
+        for i, player in enumerate(self.turn_order):
+            player.balance = state.stacks[i]
+            player.folded = state.folded[i]
@@ -1,7 +1,10 @@
 # all of these functions return False if the associated hand is not present,
 # and return the cards that create the hand if it is present
+import threading
+from collections import OrderedDict
 from enum import Enum
-from poker.cards import Rank
+from itertools import combinations_with_replacement
+from poker.cards import Rank, NUM_RANKS, NUM_SUITS, cards_to_mask
 
 NUM_HANDS = 10
 
@@ -172,19 +175,271 @@ def has_group(hand, group_size):
     return cards_of_rank[:group_size]
 
 
-def detect_hand(hand):
-    hand_funcs = [has_royal_flush, has_straight_flush, has_four_kind, has_full_house,
-                  has_flush, has_straight, has_three_kind, has_two_pair, has_pair]
+"""
+table-driven evaluation:
 
-    for hand_num in range(NUM_HANDS - 1):
-        func = hand_funcs[hand_num]
-        found = func(hand)
-        if found:
-            return PokerHand(NUM_HANDS - hand_num - 1), found
+every 5, 6 or 7 card set maps to a single integer strength, where a higher
+strength is a better hand. the top bits are the PokerHand value and the low 20
+bits hold up to five ranks (4 bits each, most significant first), so two hands
+of the same category are ordered by their kickers.
 
-    if Rank.ACE in [c.rank for c in hand]:
-        m = next(c for c in hand if c.rank == Rank.ACE)
-    else:
-        m = max(hand, key=lambda c: c.rank.value)
+ranks inside a strength are "ace high": TWO is 0 and ACE is 12. a hand's card
+mask (see poker.cards) has one 13-bit block per suit, so each block is looked
+up in a flush table, and the four blocks' rank counts are summed in base 5 to
+key a table of every non-flush rank multiset.
+"""
+CATEGORY_SHIFT = 20
+RANK_MASK = (1 << NUM_RANKS) - 1
+ACE_HIGH = NUM_RANKS - 1
+
+# how many cards make up each category (the rest of the best five are kickers)
+MADE_CARDS = [1, 2, 4, 3, 5, 5, 5, 4, 5, 5]
+
+
+def make_strength(category, ranks):
+    strength = category
+    for i in range(5):
+        strength = (strength << 4) | (ranks[i] if i < len(ranks) else 0)
+    return strength
+
+
+def strength_category(strength):
+    return PokerHand(strength >> CATEGORY_SHIFT)
+
+
+def strength_ranks(strength):
+    return [(strength >> shift) & 0xF for shift in range(16, -1, -4)]
+
+
+def high_mask(mask):
+    # suit block (bit 0 = ace) -> ace high rank bits (bit 0 = two, bit 12 = ace)
+    return (mask >> 1) | ((mask & 1) << ACE_HIGH)
+
+
+def straight_top(hmask):
+    for top in range(ACE_HIGH, 3, -1):
+        window = 0b11111 << (top - 4)
+        if hmask & window == window:
+            return top
+
+    wheel = 0b1111 | (1 << ACE_HIGH)
+    return 3 if hmask & wheel == wheel else -1
+
+
+def straight_ranks(top):
+    return [top - i for i in range(4)] + [top - 4 if top > 3 else ACE_HIGH]
+
+
+def _flush_strength(mask):
+    hmask = high_mask(mask)
+    top = straight_top(hmask)
+
+    if top == ACE_HIGH:
+        return make_strength(PokerHand.ROYAL_FLUSH.value, [top])
+    elif top >= 0:
+        return make_strength(PokerHand.STRAIGHT_FLUSH.value, [top])
+
+    ranks = [r for r in range(ACE_HIGH, -1, -1) if hmask & (1 << r)]
+    return make_strength(PokerHand.FLUSH.value, ranks[:5])
+
+
+# ranks must be sorted from highest to lowest
+def _rank_strength(ranks, straights):
+    runs = []
+    for r in ranks:
+        if runs and runs[-1][1] == r:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, r])
+
+    # biggest groups first; equal groups stay highest rank first
+    runs.sort(key=lambda run: -run[0])
+    first = runs[0][0]
+    second = runs[1][0] if len(runs) > 1 else 0
+    order = [run[1] for run in runs]
+
+    if first == 4:
+        return make_strength(PokerHand.FOUR_KIND.value, order[:1] + [max(order[1:])] if order[1:] else order)
 
-    return PokerHand.HIGH_CARD, [m]
+    if first == 3 and second >= 2:
+        return make_strength(PokerHand.FULL_HOUSE.value,
+                             [order[0], max(r for count, r in runs[1:] if count >= 2)])
+
+    top = straights[sum(1 << r for r in order)]
+    if top >= 0:
+        return make_strength(PokerHand.STRAIGHT.value, [top])
+
+    if first == 3:
+        return make_strength(PokerHand.THREE_KIND.value, order[:3])
+
+    if first == 2 and second == 2:
+        return make_strength(PokerHand.TWO_PAIR.value, order[:2] + [max(order[2:])] if order[2:] else order)
+
+    if first == 2:
+        return make_strength(PokerHand.PAIR.value, order[:4])
+
+    return make_strength(PokerHand.HIGH_CARD.value, order[:5])
+
+
+def _build_tables():
+    flush = [0] * (1 << NUM_RANKS)
+    spread = [0] * (1 << NUM_RANKS)
+    straights = [straight_top(hmask) for hmask in range(1 << NUM_RANKS)]
+    powers = [5 ** r for r in range(NUM_RANKS)]
+
+    for mask in range(1, 1 << NUM_RANKS):
+        low = mask & -mask
+        spread[mask] = spread[mask ^ low] + powers[high_mask(low).bit_length() - 1]
+        if bin(mask).count("1") >= 5:
+            flush[mask] = _flush_strength(mask)
+
+    by_key = {}
+    for size in range(1, 8):
+        for ranks in combinations_with_replacement(range(ACE_HIGH, -1, -1), size):
+            # no more than four cards of any rank
+            if size > 4 and any(ranks[i] == ranks[i + 4] for i in range(size - 4)):
+                continue
+            by_key[sum([powers[r] for r in ranks])] = _rank_strength(ranks, straights)
+
+    return flush, spread, by_key
+
+
+# FLUSH_TABLE[block] is the strength of the best flush in a suit block (0 if
+# fewer than five cards), SPREAD_TABLE[block] is the block's base-5 rank key and
+# RANK_TABLE[key] is the strength of that rank multiset when no flush is present
+FLUSH_TABLE, SPREAD_TABLE, RANK_TABLE = _build_tables()
+
+
+def evaluate_mask(mask):
+    d = mask & RANK_MASK
+    h = (mask >> NUM_RANKS) & RANK_MASK
+    c = (mask >> 2 * NUM_RANKS) & RANK_MASK
+    s = mask >> 3 * NUM_RANKS
+
+    # with at most seven cards, a flush always beats anything made without it
+    flush = FLUSH_TABLE[d] or FLUSH_TABLE[h] or FLUSH_TABLE[c] or FLUSH_TABLE[s]
+    if flush:
+        return flush
+
+    return RANK_TABLE[SPREAD_TABLE[d] + SPREAD_TABLE[h] + SPREAD_TABLE[c] + SPREAD_TABLE[s]]
+
+
+def evaluate(hand):
+    return evaluate_mask(cards_to_mask(hand))
+
+
+# returns the (up to) five cards that make up the hand, ordered from most to
+# least significant (made cards first, then kickers)
+def best_five(hand, strength=None):
+    if strength is None:
+        strength = evaluate(hand)
+
+    category = strength >> CATEGORY_SHIFT
+    ranks = strength_ranks(strength)
+
+    if category in (PokerHand.STRAIGHT.value, PokerHand.STRAIGHT_FLUSH.value,
+                    PokerHand.ROYAL_FLUSH.value):
+        groups = [(r, 1) for r in straight_ranks(ranks[0])]
+    else:
+        sizes = {
+            PokerHand.PAIR.value: [2, 1, 1, 1],
+            PokerHand.TWO_PAIR.value: [2, 2, 1],
+            PokerHand.THREE_KIND.value: [3, 1, 1],
+            PokerHand.FULL_HOUSE.value: [3, 2],
+            PokerHand.FOUR_KIND.value: [4, 1],
+        }.get(category, [1] * 5)
+        groups = list(zip(ranks, sizes))
+
+    cards = list(sorted(hand, reverse=True))
+    if category in (PokerHand.FLUSH.value, PokerHand.STRAIGHT_FLUSH.value,
+                    PokerHand.ROYAL_FLUSH.value):
+        suit_counts = [0] * NUM_SUITS
+        for c in cards:
+            suit_counts[c.suit.value] += 1
+        suit = suit_counts.index(max(suit_counts))
+        cards = [c for c in cards if c.suit.value == suit]
+
+    best = []
+    for rank, size in groups:
+        of_rank = [c for c in cards if (c.rank.value - 1) % NUM_RANKS == rank and c not in best]
+        best += of_rank[:size]
+
+    return best[:5]
+
+
+# detect_hand results kept by default
+EVALUATION_CACHE_SIZE = 8192
+
+
+# recent detect_hand results keyed by card mask, so the same cards in any order
+# are evaluated once. the least recently used result is dropped when full. one
+# lock guards it, so games on the event loop and jobs on compute threads can
+# share a cache
+class EvaluationCache:
+    def __init__(self, capacity=EVALUATION_CACHE_SIZE):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    # the result for mask, or None (counted as a miss) if it isn't kept
+    def get(self, mask):
+        with self._lock:
+            result = self._results.get(mask)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._results.move_to_end(mask)
+            return result
+
+    def put(self, mask, result):
+        with self._lock:
+            self._results[mask] = result
+            self._results.move_to_end(mask)
+            while len(self._results) > self.capacity:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+    # evaluates hand and keeps the result, without looking for it first. it's
+    # worked out outside the lock: two threads missing the same mask both
+    # evaluate it, which is cheaper than making every hit wait
+    def add(self, hand):
+        mask = cards_to_mask(hand)
+        result = _detect_hand(hand, evaluate_mask(mask))
+        self.put(mask, result)
+        return result
+
+    def detect(self, hand):
+        result = self.get(cards_to_mask(hand))
+        return self.add(hand) if result is None else result
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {"size": len(self._results), "capacity": self.capacity,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def __len__(self):
+        return len(self._results)
+
+
+EVALUATION_CACHE = EvaluationCache()
+
+
+def _detect_hand(hand, strength):
+    category = strength_category(strength)
+    return category, best_five(hand, strength)[:MADE_CARDS[category.value]]
+
+
+# the hand's category and the cards that make it. results are shared through
+# cache (pass None to always evaluate), so don't change the cards returned
+def detect_hand(hand, cache=EVALUATION_CACHE):
+    if cache is None:
+        return _detect_hand(hand, evaluate(hand))
+    return cache.detect(hand)
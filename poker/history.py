@@ -0,0 +1,197 @@
+# hand histories. every entry of a game's log is appended to a binary file as
+# it happens, and only the last few are kept in memory (for the embed), so a
+# long game uses the same memory as a short one. entries refer to players by
+# user id, so they don't keep players, users or games alive.
+#
+# file layout (little endian): a header of magic b"PKHH" and version (u16),
+# then one record per entry: its length (u16), then kind (u8), user id (u64),
+# value (u8), amount (i64), street (u8), and any data as i64s.
+#
+#   kind     user id   value            amount          street  data
+#   HAND     dealer    seats            hand number     -       (user id, stack) per seat, dealer first
+#   BLIND    player    0 small, 1 big   chips           -       -
+#   ACTION   player    CHECK ... FOLD   chips put in,   street  -
+#                                       or raise to
+#   REVEAL   -         -                -               street  card ids
+#   TIMEOUT  player    -                -               street  -
+#   RESULT   player    showed down      chips won       -       net chips for the hand
+#   GAME     -         -                -               -       the seed every shuffle came from,
+#                                                              written once the game is over
+import mmap
+import os
+import struct
+import uuid
+from array import array
+from collections import deque
+from datetime import datetime
+
+from helpers import english_list
+from poker.cards import CARDS
+from poker.engine import ACTION_NAMES, RAISE
+
+MAGIC = b"PKHH"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sH")
+LENGTH = struct.Struct("<H")
+RECORD = struct.Struct("<BQBqB")
+DATUM = struct.Struct("<q")
+
+HAND, BLIND, ACTION, REVEAL, TIMEOUT, RESULT, GAME = range(7)
+
+# entries kept in memory, and entries per page of the log
+RING_SIZE = 64
+PAGE_SIZE = 4
+
+# where games write their histories; empty to keep them in memory only
+HISTORY_DIR = os.environ.get("HISTORY_DIR", "histories")
+
+
+# a fresh file name for a game's history, or None if histories aren't saved
+def new_history_path():
+    if not HISTORY_DIR:
+        return None
+    return os.path.join(HISTORY_DIR, f"{datetime.utcnow():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.pkh")
+
+
+def mention(user_id):
+    return f"<@{user_id}>"
+
+
+class Entry:
+    __slots__ = ("kind", "user_id", "value", "amount", "street", "data")
+
+    def __init__(self, kind, user_id=0, value=0, amount=0, street=0, data=()):
+        self.kind = kind
+        self.user_id = user_id
+        self.value = value
+        self.amount = amount
+        self.street = street
+        self.data = data
+
+    def encode(self):
+        body = RECORD.pack(self.kind, self.user_id, self.value, self.amount, self.street) + \
+            struct.pack(f"<{len(self.data)}q", *self.data)
+        return LENGTH.pack(len(body)) + body
+
+    @classmethod
+    def decode(cls, body):
+        kind, user_id, value, amount, street = RECORD.unpack_from(body)
+        data = struct.unpack_from(f"<{(len(body) - RECORD.size) // DATUM.size}q", body, RECORD.size)
+        return cls(kind, user_id, value, amount, street, data)
+
+    def __str__(self):
+        who = mention(self.user_id)
+        if self.kind == HAND:
+            return f"{who} deals."
+        if self.kind == BLIND:
+            return f"{who} places {self.amount} as the {'big' if self.value else 'small'} blind."
+        if self.kind == ACTION:
+            s = f"{who} {ACTION_NAMES[self.value]}s"
+            if self.value == RAISE:
+                s += " to " + str(self.amount)
+            return s + "."
+        if self.kind == REVEAL:
+            return english_list([CARDS[card_id] for card_id in self.data]) + " revealed."
+        if self.kind == TIMEOUT:
+            return f"{who} ran out of time."
+        if self.kind == RESULT:
+            net = self.data[0] if self.data else 0
+            return f"{who} wins {self.amount}." if net >= 0 else f"{who} loses {-net}."
+        if self.kind == GAME:
+            return f"Shuffling with seed {self.data[0]}."
+        return f"unknown entry {self.kind}"
+
+
+def check_header(buffer, path):
+    if len(buffer) < FILE_HEADER.size or FILE_HEADER.unpack_from(buffer) != (MAGIC, VERSION):
+        raise ValueError(f"{path} is not a version {VERSION} hand history")
+
+
+# (offset just past the entry, entry) for every entry in buffer from offset on.
+# a record cut off by the end of the buffer (a game still writing it) ends it
+def iter_entries(buffer, offset=FILE_HEADER.size):
+    size = len(buffer)
+    while offset + LENGTH.size <= size:
+        length, = LENGTH.unpack_from(buffer, offset)
+        start = offset + LENGTH.size
+        end = start + length
+        if end > size:
+            return
+        yield end, Entry.decode(buffer[start:end])
+        offset = end
+
+
+# every entry of a history file, streamed from a memory map of it
+def read_history(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < FILE_HEADER.size:
+            check_header(b"", path)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            check_header(buffer, path)
+            for _, entry in iter_entries(buffer):
+                yield entry
+
+
+class HandHistory:
+    # path None keeps no file, so only the last RING_SIZE entries can be paged to
+    def __init__(self, path=None, ring_size=RING_SIZE, page_size=PAGE_SIZE):
+        self.path = path
+        self.recent = deque(maxlen=ring_size)
+        self.page_size = page_size
+        self.count = 0
+        # file offset of the first entry of every page
+        self.page_offsets = array("Q")
+        self._file = None
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._file = open(path, "wb")
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+    def append(self, entry):
+        if self._file:
+            if self.count % self.page_size == 0:
+                self.page_offsets.append(self._file.tell())
+            self._file.write(entry.encode())
+            if entry.kind == RESULT:
+                # a hand is over; make sure it's on disk
+                self._file.flush()
+
+        self.recent.append(entry)
+        self.count += 1
+
+    @property
+    def num_pages(self):
+        return max((self.count + self.page_size - 1) // self.page_size, 1)
+
+    # the entries on page number (0 is the oldest), from memory if they are
+    # still there and otherwise from the file
+    def page(self, number):
+        first = number * self.page_size
+        last = min(first + self.page_size, self.count)
+        if first >= last:
+            return []
+
+        oldest_kept = self.count - len(self.recent)
+        if first >= oldest_kept:
+            return [self.recent[i - oldest_kept] for i in range(first, last)]
+        if not self.path:
+            return []
+
+        if self._file:
+            self._file.flush()
+        start = self.page_offsets[number]
+        end = self.page_offsets[number + 1] if number + 1 < len(self.page_offsets) else None
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            chunk = f.read(end - start if end is not None else -1)
+
+        return [entry for _, entry in iter_entries(chunk, 0)]
+
+    def last_page(self):
+        return self.page(self.num_pages - 1)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
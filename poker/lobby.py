@@ -0,0 +1,68 @@
+# a game's join window. joiners are collected as raw reaction events arrive
+# (through the EventRouter), so starting the game needs no reaction paging
+# and the lobby message never has to be found in the message cache
+import asyncio
+
+JOIN_EMOJI = "✅"
+# how many times the countdown on the lobby message is updated
+COUNTDOWN_STEPS = 4
+
+
+class Lobby:
+    def __init__(self, client, author, max_players, is_free=lambda user_id: True):
+        self.client = client
+        self.author = author
+        self.max_players = max_players
+        # called with a user id; users who aren't free (e.g. already playing) can't join
+        self.is_free = is_free
+        # user id -> user, in the order they joined (None until the user is known)
+        self.joined = {author.id: author}
+        self.cancelled = False
+        self._done = asyncio.Event()
+
+    def on_reaction_add(self, payload):
+        user_id = payload.user_id
+        if str(payload.emoji) != JOIN_EMOJI or user_id == self.client.user.id or user_id in self.joined:
+            return
+        if len(self.joined) >= self.max_players or not self.is_free(user_id):
+            return
+
+        self.joined[user_id] = payload.member or self.client.get_user(user_id)
+        if len(self.joined) == self.max_players:
+            self._done.set()
+
+    def on_reaction_remove(self, payload):
+        if str(payload.emoji) == JOIN_EMOJI and payload.user_id != self.author.id:
+            self.joined.pop(payload.user_id, None)
+
+    def cancel(self):
+        self.cancelled = True
+        self._done.set()
+
+    # counts down on the message, and returns the users who joined (author
+    # first), or None if the lobby was cancelled. ends early once it's full
+    async def run(self, router, message, pre_message, timeout):
+        router.listen(message.id, self)
+        try:
+            await message.add_reaction(JOIN_EMOJI)
+
+            for step in range(COUNTDOWN_STEPS - 1, -1, -1):
+                try:
+                    await asyncio.wait_for(self._done.wait(), timeout / COUNTDOWN_STEPS)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+
+                if step:
+                    await message.edit(content=pre_message + f"{step / COUNTDOWN_STEPS * timeout} seconds left!")
+        finally:
+            router.unlisten(message.id)
+
+        if self.cancelled:
+            return None
+
+        users = []
+        for user_id, user in self.joined.items():
+            # only for users the reaction event didn't include and who aren't cached
+            users.append(user or await self.client.fetch_user(user_id))
+        return users
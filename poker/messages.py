@@ -0,0 +1,72 @@
+# handles to messages the bot has sent, so they can be edited, reacted to and
+# deleted without searching client.cached_messages (a linear scan that also
+# misses once the message is evicted from the cache)
+
+
+class MessageHandle:
+    # on_call, if given, is called with "fetch", "edit", "reaction" or "delete" before each api call
+    def __init__(self, channel, message_id, message=None, on_call=None):
+        self.channel = channel
+        self.id = message_id
+        self._message = message
+        self.on_call = on_call
+
+    # the message returned by send, or a partial message rebuilt from the
+    # channel and id if there isn't one (both support edit, delete and reactions)
+    @property
+    def message(self):
+        if self._message is None:
+            self._message = self.channel.get_partial_message(self.id)
+        return self._message
+
+    def _call(self, kind):
+        if self.on_call:
+            self.on_call(kind)
+
+    # the full message as it is now, reactions included (costs an api call)
+    async def fetch(self):
+        self._call("fetch")
+        self._message = await self.channel.fetch_message(self.id)
+        return self._message
+
+    async def edit(self, **kwargs):
+        self._call("edit")
+        return await self.message.edit(**kwargs)
+
+    async def add_reaction(self, emoji):
+        self._call("reaction")
+        return await self.message.add_reaction(emoji)
+
+    async def clear_reactions(self):
+        self._call("reaction")
+        return await self.message.clear_reactions()
+
+    async def delete(self):
+        self._call("delete")
+        return await self.message.delete()
+
+
+class MessageRegistry:
+    def __init__(self, on_call=None):
+        self._handles = {}
+        self.on_call = on_call
+
+    def add(self, message):
+        handle = MessageHandle(message.channel, message.id, message, self.on_call)
+        self._handles[message.id] = handle
+        return handle
+
+    def get(self, message_id):
+        return self._handles.get(message_id)
+
+    def remove(self, message_id):
+        return self._handles.pop(message_id, None)
+
+    def __contains__(self, message_id):
+        return message_id in self._handles
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __iter__(self):
+        return iter(self._handles.values())
@@ -0,0 +1,209 @@
+# runtime metrics: latency histograms, counters and gauges, shown by !stats and
+# written periodically as a prometheus text file (for node_exporter's textfile
+# collector). recording is a perf_counter call and a bisect, so it can sit on
+# the hot path.
+import asyncio
+import functools
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+PREFIX = "pokerbot_"
+# histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+                   float("inf"))
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, float("inf"))
+
+# where to write the prometheus file, if anywhere, and how often
+TEXTFILE_PATH = os.environ.get("METRICS_PATH")
+TEXTFILE_INTERVAL = 15
+# how often the event loop lag is sampled
+LAG_INTERVAL = 0.5
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # estimated by interpolating inside the bucket the quantile falls in
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= target:
+                low = self.bounds[i - 1] if i else 0.0
+                high = self.bounds[i]
+                if high == float("inf"):
+                    return low
+                return low + (high - low) * (target - seen) / count
+            seen += count
+        return self.bounds[-2]
+
+
+def _labels(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+
+class Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+# a Timer that leaves out the time spent in its paused() blocks, e.g. waiting on people
+class PausableTimer(Timer):
+    __slots__ = ("paused_for",)
+
+    def __enter__(self):
+        self.paused_for = 0.0
+        return super().__enter__()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start - self.paused_for)
+
+    @contextmanager
+    def paused(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.paused_for += time.perf_counter() - start
+
+
+class Metrics:
+    def __init__(self):
+        # name -> {sorted label pairs -> Histogram / count}
+        self.histograms = {}
+        self.counters = {}
+        # name -> function returning the current value
+        self.gauges = {}
+        self.started = time.time()
+
+    def histogram(self, name, bounds=LATENCY_BUCKETS, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(bounds)
+        return histogram
+
+    def observe(self, name, value, bounds=LATENCY_BUCKETS, **labels):
+        self.histogram(name, bounds, **labels).observe(value)
+
+    # with metrics.time("name", label=...): records how long the block took
+    def time(self, name, pausable=False, **labels):
+        return (PausableTimer if pausable else Timer)(self.histogram(name, **labels))
+
+    def inc(self, name, amount=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    def gauge(self, name, func):
+        self.gauges[name] = func
+
+    def counter_total(self, name):
+        return sum(self.counters.get(name, {}).values())
+
+    def prometheus(self):
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{PREFIX}{name}{{{_labels(key)}}} {value}")
+
+        for name, func in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            lines.append(f"{PREFIX}{name} {func()}")
+
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for key, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{PREFIX}{name}_bucket{{{_labels(key + (('le', le),))}}} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{{{_labels(key)}}} {histogram.sum}")
+                lines.append(f"{PREFIX}{name}_count{{{_labels(key)}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    # a few lines for !stats
+    def summary(self):
+        lines = [f"Up {time.time() - self.started:,.0f}s"]
+        for name, func in sorted(self.gauges.items()):
+            lines.append(f"{name}: {func()}")
+
+        for name, series in sorted(self.counters.items()):
+            parts = ", ".join(f"{_labels(key) or 'total'} {value}" for key, value in sorted(series.items()))
+            lines.append(f"{name}: {parts}")
+
+        for name, series in sorted(self.histograms.items()):
+            for key, histogram in sorted(series.items()):
+                if histogram.count:
+                    lines.append(f"{name}{{{_labels(key)}}}: n={histogram.count} "
+                                 f"p50={histogram.quantile(0.5):.4g} p99={histogram.quantile(0.99):.4g}")
+        return "\n".join(lines)
+
+
+METRICS = Metrics()
+
+
+def _write_textfile(path, text):
+    # the collector may read at any time, so never let it see a half written file
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        f.write(text)
+    os.replace(temp, path)
+
+
+# decorates a coroutine function to record how long each call takes
+def timed(name, metrics=METRICS, **labels):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with metrics.time(name, **labels):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# records how late the event loop wakes up from a sleep, forever
+async def sample_loop_lag(metrics=METRICS, interval=LAG_INTERVAL):
+    last = [0.0]
+    metrics.gauge("event_loop_lag_last_seconds", lambda: last[0])
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        last[0] = max(time.perf_counter() - start - interval, 0.0)
+        metrics.observe("event_loop_lag_seconds", last[0])
+
+
+# writes the prometheus file every interval seconds, forever
+async def write_textfile_periodically(path, metrics=METRICS, interval=TEXTFILE_INTERVAL):
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(interval)
+        # rendered here, since the metrics are only safe to read from the loop
+        await loop.run_in_executor(None, _write_textfile, path, metrics.prometheus())
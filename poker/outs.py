@@ -0,0 +1,86 @@
+# outs on the flop and turn: the cards still in the deck that would help a hand
+# if they came next. every unseen card is added to every player's hand and the
+# lot is evaluated in one batch (see poker.batch), so there's no loop over cards.
+#
+# a card improves a hand if it makes a better PokerHand category than the hand
+# has now, and beats the leader if it puts a player who is behind now strictly
+# ahead of everyone (with the card on the board for them too).
+import numpy as np
+
+from poker.batch import CARD_MASK, evaluate_masks, categories
+from poker.cards import CARDS, CARDS_IN_DECK, cards_to_mask
+from poker.equity import BOARD_SIZE
+from poker.hands import PokerHand
+
+
+class Outs:
+    def __init__(self, category, improve, beat_leader, unseen):
+        # the PokerHand made now
+        self.category = category
+        # PokerHand -> the cards that improve the hand to it, best first
+        self.improve = improve
+        # cards that take this player from behind to ahead; empty for the leader
+        self.beat_leader = beat_leader
+        # how many cards might come next
+        self.unseen = unseen
+
+    @property
+    def num_improve(self):
+        return sum(map(len, self.improve.values()))
+
+    # every card that is an out for either reason
+    @property
+    def cards(self):
+        return sorted({c for cards in self.improve.values() for c in cards} | set(self.beat_leader))
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __str__(self):
+        s = f"Outs: {self.num_improve} to improve"
+        if self.improve:
+            s += " (" + ", ".join(f"{category.real_name()} {len(cards)}"
+                                  for category, cards in self.improve.items()) + ")"
+        if self.beat_leader:
+            s += f", {len(self.beat_leader)} to take the lead"
+        return s
+
+
+# an Outs for each hand, with board the flop or turn and dead any other cards
+# known to be out of the deck
+def find_outs(hands, board, dead=()):
+    assert 3 <= len(board) < BOARD_SIZE, "outs are for the flop and turn"
+    hole = [cards_to_mask(hand) for hand in hands]
+    board_mask = cards_to_mask(board)
+    known = board_mask | cards_to_mask(dead)
+    for mask in hole:
+        assert not mask & known, "a card can't be in two places at once"
+        known |= mask
+    unseen = np.array([i for i in range(CARDS_IN_DECK) if not known >> i & 1], dtype=np.intp)
+
+    masks = np.array(hole, dtype=np.uint64) | np.uint64(board_mask)
+    now = evaluate_masks(masks)
+    # after[i, j] is player i's strength if unseen[j] comes next
+    after = evaluate_masks((masks[:, None] | CARD_MASK[unseen][None, :]).ravel()).reshape(len(hands), len(unseen))
+
+    # a player is strictly ahead after a card if they have the best hand and
+    # the next best is worse (so not a tie)
+    ranked = np.sort(after, axis=0)
+    best = ranked[-1]
+    second = ranked[-2] if len(hands) > 1 else np.full_like(best, -1)
+    ahead = (after == best) & (after > second)
+    behind = now < now.max()
+
+    now_categories = categories(now).tolist()
+    after_categories = categories(after)
+    results = []
+    for i in range(len(hands)):
+        improved = after_categories[i] > now_categories[i]
+        improve = {}
+        for category in sorted(set(after_categories[i][improved].tolist()), reverse=True):
+            ids = unseen[improved & (after_categories[i] == category)]
+            improve[PokerHand(category)] = [CARDS[card_id] for card_id in ids.tolist()]
+
+        beat_leader = [CARDS[card_id] for card_id in unseen[ahead[i]].tolist()] if behind[i] else []
+        results.append(Outs(PokerHand(now_categories[i]), improve, beat_leader, len(unseen)))
+    return results
@@ -0,0 +1,140 @@
+# preflop equity of each of the 169 canonical starting hands against 1 to 7
+# random opponents. the table is generated once (python -m poker.preflop) into
+# a small versioned binary file, and loaded by memory-mapping it, so every
+# process using it shares the same pages and nothing is computed at startup.
+#
+# file layout (little endian):
+#   header:  magic b"PKEQ", version (u16), hands (u16), max opponents (u16),
+#            padding (u16), crc32 of the payload (u32)
+#   payload: float32 equities, one row of 169 hands per opponent count
+import argparse
+import mmap
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from poker.batch import CARD_MASK, hand_masks, evaluate_masks
+from poker.cards import NUM_RANKS, CARDS_IN_DECK
+from poker.equity import BOARD_SIZE, outcomes
+
+MAGIC = b"PKEQ"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHHI")
+NUM_STARTING_HANDS = NUM_RANKS * NUM_RANKS
+MAX_OPPONENTS = 7
+
+DEFAULT_PATH = os.environ.get("PREFLOP_TABLE_PATH",
+                              os.path.join(os.path.dirname(__file__), "data", "preflop_equity.bin"))
+DEFAULT_SAMPLES = 50_000
+
+
+def _high_rank(card):
+    return (card.rank.value - 1) % NUM_RANKS
+
+
+# the 169 starting hands as a 13x13 grid of ace high ranks: pairs on the
+# diagonal, suited hands below it (row = higher rank) and offsuit hands above
+# it (row = lower rank)
+def starting_hand_index(hand):
+    c1, c2 = hand
+    high, low = sorted((_high_rank(c1), _high_rank(c2)), reverse=True)
+    if c1.suit == c2.suit:
+        return high * NUM_RANKS + low
+    return low * NUM_RANKS + high
+
+
+# one concrete pair of card ids for each grid position
+def _representative(index):
+    row, col = divmod(index, NUM_RANKS)
+    # card id = suit * 13 + enum rank, where the enum puts the ace first
+    rank1, rank2 = (row + 1) % NUM_RANKS, (col + 1) % NUM_RANKS
+    suit2 = 0 if row > col else 1
+    return [rank1, suit2 * NUM_RANKS + rank2]
+
+
+class PreflopTable:
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, hands, opponents, _, checksum = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} preflop equity table")
+        if (hands, opponents) != (NUM_STARTING_HANDS, MAX_OPPONENTS):
+            raise ValueError(f"{path} has the wrong shape")
+
+        payload = memoryview(self._mmap)[HEADER.size:]
+        if zlib.crc32(payload) != checksum:
+            raise ValueError(f"{path} failed its checksum; regenerate it")
+
+        self.table = np.frombuffer(payload, dtype="<f4").reshape(MAX_OPPONENTS, NUM_STARTING_HANDS)
+
+    def equity(self, hand, opponents=1):
+        assert 1 <= opponents <= MAX_OPPONENTS, f"can only look up 1 to {MAX_OPPONENTS} opponents"
+        return float(self.table[opponents - 1, starting_hand_index(hand)])
+
+
+_table = None
+
+
+# the shared table, or None if it hasn't been generated
+def get_preflop_table():
+    global _table
+    if _table is None and os.path.exists(DEFAULT_PATH):
+        _table = PreflopTable(DEFAULT_PATH)
+    return _table
+
+
+def _simulate(index, opponents, samples, seed):
+    rng = np.random.default_rng(seed)
+    hero = _representative(index)
+    remaining = np.array([i for i in range(CARDS_IN_DECK) if i not in hero], dtype=np.int8)
+
+    needed = 2 * opponents + BOARD_SIZE
+    keys = rng.random((samples, len(remaining)))
+    # argpartition picks a uniform set of cards but leaves them in no random
+    # order, so shuffle them before handing them out by position
+    dealt = rng.permuted(remaining[np.argpartition(keys, needed - 1, axis=1)[:, :needed]], axis=1)
+    board = hand_masks(dealt[:, -BOARD_SIZE:])
+
+    strengths = np.empty((opponents + 1, samples), dtype=np.int32)
+    strengths[0] = evaluate_masks(board | CARD_MASK[hero[0]] | CARD_MASK[hero[1]])
+    for i in range(opponents):
+        strengths[i + 1] = evaluate_masks(board | hand_masks(dealt[:, 2 * i:2 * i + 2]))
+
+    return outcomes(strengths)[2][0] / samples
+
+
+def generate(path=DEFAULT_PATH, samples=DEFAULT_SAMPLES, seed=0):
+    jobs = [(index, opponents) for opponents in range(1, MAX_OPPONENTS + 1)
+            for index in range(NUM_STARTING_HANDS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(jobs))
+
+    with ProcessPoolExecutor() as pool:
+        futures = [pool.submit(_simulate, index, opponents, samples, s)
+                   for (index, opponents), s in zip(jobs, seeds)]
+        table = np.array([f.result() for f in futures], dtype="<f4")
+
+    payload = table.tobytes()
+    header = HEADER.pack(MAGIC, VERSION, NUM_STARTING_HANDS, MAX_OPPONENTS, 0, zlib.crc32(payload))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # write to a temporary file first so readers never map a half-written table
+    with open(path + ".tmp", "wb") as f:
+        f.write(header + payload)
+    os.replace(path + ".tmp", path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the preflop equity table.")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES,
+                        help="deals simulated per hand and opponent count")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.path, args.samples, args.seed)
+    print(f"Wrote {args.path}")
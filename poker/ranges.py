@@ -0,0 +1,312 @@
+# equity between two hand ranges, for reviewing hands.
+#
+#   python -m poker.ranges "QQ+, AKs" "TT-88, AQs+, KQo" --board Ah7d2c
+#
+# a range is written in the usual notation: pairs (QQ), suited (AKs) and
+# offsuit (AKo) hands or both (AK), "+" for everything above on the lower card
+# (QQ+, ATs+), dashes between two hands (22-55, A2s-A5s), exact hands (AhKh),
+# and ":weight" after any of them (AKo:0.5). it expands into combos, each a
+# pair of card ids with a weight, less any blocked by the board or dead cards.
+#
+# every combo of one range is played against every combo of the other over
+# the same runouts (all of them after the flop, a seeded sample before), all
+# evaluated with the batch evaluator. that gives a combo vs combo equity
+# matrix, reduced to range equity by the combos' weights. results are saved
+# in CACHE_DIR keyed by a fingerprint of the expanded ranges, board and dead
+# cards, so writing a range differently (or the board in another order) still
+# finds them.
+import argparse
+import hashlib
+import math
+import os
+import re
+
+import numpy as np
+
+from poker.batch import hand_masks, evaluate_masks
+from poker.cards import NUM_RANKS, NUM_SUITS, CARDS, CARDS_IN_DECK, binomial
+from poker.equity import BOARD_SIZE
+from poker.runouts import combinations_array
+
+# ace high, as strength ranks are
+RANK_CHARS = "23456789TJQKA"
+# in Suit order
+SUIT_CHARS = "dhcs"
+
+# boards with more runouts than this are sampled
+MAX_EXACT_RUNOUTS = 50_000
+DEFAULT_SAMPLES = 5_000
+# bounds the (combos, combos, runouts) temporaries
+CELLS_PER_CHUNK = 1 << 22
+
+CACHE_DIR = os.environ.get("RANGE_CACHE_DIR", "range_cache")
+# part of every fingerprint; bump it when results would change
+CACHE_VERSION = 1
+
+_HANDS = re.compile(rf"([{RANK_CHARS}])([{RANK_CHARS}])([so]?)")
+_EXACT = re.compile(rf"([{RANK_CHARS}][{SUIT_CHARS}]){{2}}")
+
+
+def _card_id(rank, suit):
+    # the Rank enum puts the ace first
+    return suit * NUM_RANKS + (rank + 1) % NUM_RANKS
+
+
+def parse_card(text):
+    if len(text) != 2 or text[0] not in RANK_CHARS or text[1] not in SUIT_CHARS:
+        raise ValueError(f"can't read {text!r} as a card")
+    return CARDS[_card_id(RANK_CHARS.index(text[0]), SUIT_CHARS.index(text[1]))]
+
+
+# "Ah7d2c" -> [Ace of Hearts, Seven of Diamonds, Two of Clubs]
+def parse_cards(text):
+    text = re.sub(r"[\s,]", "", text)
+    return [parse_card(text[i:i + 2]) for i in range(0, len(text), 2)]
+
+
+def _combo(a, b):
+    return (a, b) if a < b else (b, a)
+
+
+# every combo of the two ranks; suited is True, False or None for either
+def _rank_combos(high, low, suited):
+    if high == low:
+        return [_combo(_card_id(high, s1), _card_id(high, s2))
+                for s1 in range(NUM_SUITS) for s2 in range(s1 + 1, NUM_SUITS)]
+    return [_combo(_card_id(high, s1), _card_id(low, s2))
+            for s1 in range(NUM_SUITS) for s2 in range(NUM_SUITS)
+            if suited is None or (s1 == s2) == suited]
+
+
+def _read_hands(text, token):
+    match = _HANDS.fullmatch(text)
+    if match is None:
+        raise ValueError(f"can't read {token!r} as a range")
+    high, low = sorted((RANK_CHARS.index(match[1]), RANK_CHARS.index(match[2])), reverse=True)
+    if high == low and match[3]:
+        raise ValueError(f"pairs can't be suited or offsuit in {token!r}")
+    return high, low, {"s": True, "o": False}.get(match[3])
+
+
+def _token_combos(token):
+    if _EXACT.fullmatch(token):
+        a, b = parse_card(token[:2]).id, parse_card(token[2:]).id
+        if a == b:
+            raise ValueError(f"{token!r} uses the same card twice")
+        return [_combo(a, b)]
+
+    if "-" in token:
+        first, last = token.split("-", 1)
+        (high1, low1, suited1), (high2, low2, suited2) = _read_hands(first, token), _read_hands(last, token)
+        if high1 == low1 and high2 == low2:
+            # 22-55
+            ranks = [(r, r) for r in range(min(high1, high2), max(high1, high2) + 1)]
+        elif high1 == high2 and suited1 == suited2 and high1 not in (low1, low2):
+            # A2s-A5s
+            ranks = [(high1, r) for r in range(min(low1, low2), max(low1, low2) + 1)]
+        else:
+            raise ValueError(f"{token!r} isn't a range of pairs or of one card with a run of kickers")
+        suited = suited1
+    else:
+        plus = token.endswith("+")
+        high, low, suited = _read_hands(token[:-1] if plus else token, token)
+        if not plus:
+            ranks = [(high, low)]
+        elif high == low:
+            # QQ+
+            ranks = [(r, r) for r in range(high, NUM_RANKS)]
+        else:
+            # ATs+: the kicker goes up to one below the top card
+            ranks = [(high, r) for r in range(low, high)]
+
+    return [combo for high, low in ranks for combo in _rank_combos(high, low, suited)]
+
+
+# "QQ+, AKs:0.5" -> {(card id, card id): weight}. a combo named twice keeps
+# the last weight given for it
+def parse_range(text):
+    combos = {}
+    for token in re.split(r"[,\s]+", text.strip()):
+        if not token:
+            continue
+        weight = 1.0
+        if ":" in token:
+            token, weight = token.split(":", 1)
+            try:
+                weight = float(weight)
+            except ValueError:
+                raise ValueError(f"can't read {weight!r} as a weight") from None
+            if not 0 <= weight <= 1:
+                raise ValueError(f"weights must be between 0 and 1, not {weight}")
+        for combo in _token_combos(token):
+            combos[combo] = weight
+    return combos
+
+
+# the range's combos (as an (n, 2) array of card ids) and their weights,
+# without those blocked by known cards or weighted zero
+def expand_range(range_, known=()):
+    if isinstance(range_, str):
+        range_ = parse_range(range_)
+    known = {c.id for c in known}
+    combos = sorted(combo for combo, weight in range_.items()
+                    if weight > 0 and not known.intersection(combo))
+    ids = np.array(combos, dtype=np.int8).reshape(len(combos), 2)
+    return ids, np.array([range_[combo] for combo in combos], dtype=np.float64)
+
+
+class RangeEquity:
+    def __init__(self, combos_a, weights_a, combos_b, weights_b, matrix, runouts, exact):
+        self.combos_a = combos_a
+        self.weights_a = weights_a
+        self.combos_b = combos_b
+        self.weights_b = weights_b
+        # matrix[i, j] is combo i of a's equity against combo j of b, or nan
+        # where the two share a card
+        self.matrix = matrix
+        self.runouts = runouts
+        self.exact = exact
+
+    # each pair of combos counts by the product of their weights
+    def _pair_weights(self):
+        return np.where(np.isnan(self.matrix), 0.0, self.weights_a[:, None] * self.weights_b[None, :])
+
+    @property
+    def equity(self):
+        weights = self._pair_weights()
+        total = weights.sum()
+        return float((weights * np.nan_to_num(self.matrix)).sum() / total) if total else math.nan
+
+    # each of a's combos' equity against the whole of b
+    def combo_equity(self):
+        weights = self._pair_weights()
+        totals = weights.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (weights * np.nan_to_num(self.matrix)).sum(axis=1) / totals
+
+    def save(self, path):
+        # np.savez adds .npz to names without it, so write to a name that has it
+        temp = path + ".tmp.npz"
+        np.savez(temp, combos_a=self.combos_a, weights_a=self.weights_a, combos_b=self.combos_b,
+                 weights_b=self.weights_b, matrix=self.matrix, runouts=self.runouts, exact=self.exact)
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["combos_a"], data["weights_a"], data["combos_b"], data["weights_b"],
+                       data["matrix"], int(data["runouts"]), bool(data["exact"]))
+
+
+def _runouts(remaining, needed, samples, seed):
+    if binomial(len(remaining), needed) <= MAX_EXACT_RUNOUTS:
+        return remaining[combinations_array(len(remaining), needed)], True
+
+    # the `needed` smallest of a row of random keys pick a uniform runout
+    keys = np.random.default_rng(seed).random((samples, len(remaining)))
+    return remaining[np.argpartition(keys, needed - 1, axis=1)[:, :needed]], False
+
+
+# the combo vs combo equity matrix over every runout of the board (or samples
+# of them when there are too many), all evaluated up front in one batch per range
+def equity_matrix(combos_a, combos_b, board=(), dead=(), samples=DEFAULT_SAMPLES, seed=0):
+    board_mask = sum(c.mask for c in board)
+    known = board_mask | sum(c.mask for c in dead)
+    remaining = np.array([i for i in range(CARDS_IN_DECK) if not known >> i & 1], dtype=np.int8)
+    needed = BOARD_SIZE - len(board)
+
+    if needed:
+        runouts, exact = _runouts(remaining, needed, samples, seed)
+        boards = hand_masks(runouts) | np.uint64(board_mask)
+    else:
+        boards, exact = np.array([board_mask], dtype=np.uint64), True
+
+    def strengths(combos):
+        masks = hand_masks(combos)[:, None]
+        # a combo can't be dealt on a runout that uses one of its cards
+        live = (masks & boards[None, :]) == 0
+        return evaluate_masks((masks | boards[None, :]).ravel()).reshape(live.shape), live
+
+    strengths_a, live_a = strengths(combos_a)
+    strengths_b, live_b = strengths(combos_b)
+
+    shares = np.zeros((len(combos_a), len(combos_b)))
+    chunk = max(CELLS_PER_CHUNK // max(len(combos_a) * len(combos_b), 1), 1)
+    for start in range(0, len(boards), chunk):
+        a = strengths_a[:, None, start:start + chunk]
+        b = strengths_b[None, :, start:start + chunk]
+        both = live_a[:, None, start:start + chunk] & live_b[None, :, start:start + chunk]
+        # a win is worth 1 and a tie 1/2, counted in halves until the end
+        shares += (both * (2 * (a > b) + (a == b))).sum(axis=2)
+
+    played = live_a.astype(np.float64) @ live_b.T.astype(np.float64)
+    blocked = (hand_masks(combos_a)[:, None] & hand_masks(combos_b)[None, :]) != 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        matrix = np.where(blocked | (played == 0), np.nan, shares / 2 / played)
+    return matrix, len(boards), exact
+
+
+def fingerprint(range_a, range_b, board=(), dead=(), samples=DEFAULT_SAMPLES):
+    ids_a, weights_a = range_a
+    ids_b, weights_b = range_b
+    canonical = repr((CACHE_VERSION, ids_a.tolist(), weights_a.tolist(), ids_b.tolist(), weights_b.tolist(),
+                      sorted(c.id for c in board), sorted(c.id for c in dead), samples))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+# range_a's equity against range_b as a RangeEquity. ranges are strings or
+# parsed ranges; with a cache_dir, results are read from and saved there
+def range_equity(range_a, range_b, board=(), dead=(), samples=DEFAULT_SAMPLES, cache_dir=CACHE_DIR):
+    known = list(board) + list(dead)
+    assert len({c.id for c in known}) == len(known), "a card can't be in two places at once"
+    assert len(board) <= BOARD_SIZE, "can't have more than 5 cards on the table"
+
+    expanded_a, expanded_b = expand_range(range_a, known), expand_range(range_b, known)
+    key = fingerprint(expanded_a, expanded_b, board, dead, samples)
+    path = os.path.join(cache_dir, key + ".npz") if cache_dir else None
+    if path and os.path.exists(path):
+        return RangeEquity.load(path)
+
+    # seeded from the fingerprint, so a sampled result is the same every time
+    matrix, runouts, exact = equity_matrix(expanded_a[0], expanded_b[0], board, dead, samples, int(key[:16], 16))
+    result = RangeEquity(*expanded_a, *expanded_b, matrix, runouts, exact)
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        result.save(path)
+    return result
+
+
+def _combo_name(ids):
+    ranks = sorted((((CARDS[i].rank.value - 1) % NUM_RANKS, CARDS[i].suit.value) for i in ids.tolist()), reverse=True)
+    return "".join(RANK_CHARS[rank] + SUIT_CHARS[suit] for rank, suit in ranks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Equity of one hand range against another.")
+    parser.add_argument("range_a")
+    parser.add_argument("range_b")
+    parser.add_argument("--board", default="", help="e.g. Ah7d2c")
+    parser.add_argument("--dead", default="", help="cards known to be out of the deck")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="runouts sampled preflop")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="empty to not cache")
+    parser.add_argument("--top", type=int, default=10, help="combos of the first range to list, best first")
+    args = parser.parse_args()
+
+    try:
+        result = range_equity(args.range_a, args.range_b, parse_cards(args.board), parse_cards(args.dead),
+                              args.samples, args.cache_dir)
+    except ValueError as e:
+        parser.error(str(e))
+
+    how = "every runout" if result.exact else "sampled runouts"
+    print(f"{len(result.combos_a)} combos vs {len(result.combos_b)} combos over {result.runouts:,} {how}")
+    print(f"{args.range_a}: {result.equity:.2%}")
+    print(f"{args.range_b}: {1 - result.equity:.2%}")
+
+    combo_equity = result.combo_equity()
+    for i in np.argsort(-np.nan_to_num(combo_equity, nan=-1))[:args.top]:
+        print(f"  {_combo_name(result.combos_a[i]):<6} {combo_equity[i]:.2%}")
+
+
+if __name__ == "__main__":
+    main()
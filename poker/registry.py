@@ -0,0 +1,54 @@
+# every running game, indexed by the users playing it and the channel and guild
+# it was started in. games remove themselves when they finish (see Game.finish)
+
+
+class GameRegistry:
+    def __init__(self):
+        self.by_user = {}
+        self.by_channel = {}
+        self.by_guild = {}
+        self._places = {}
+
+    def add(self, game, channel_id, guild_id=None):
+        for player in game.players:
+            assert player.user.id not in self.by_user, "a user can only be in one game at a time"
+
+        for player in game.players:
+            self.by_user[player.user.id] = game
+        self.by_channel.setdefault(channel_id, set()).add(game)
+        self.by_guild.setdefault(guild_id, set()).add(game)
+        self._places[game] = channel_id, guild_id
+
+        game.on_finish.append(self.remove)
+
+    def remove(self, game):
+        if game not in self._places:
+            return
+
+        channel_id, guild_id = self._places.pop(game)
+        for player in game.players:
+            if self.by_user.get(player.user.id) is game:
+                del self.by_user[player.user.id]
+
+        for index, key in ((self.by_channel, channel_id), (self.by_guild, guild_id)):
+            index[key].discard(game)
+            if not index[key]:
+                del index[key]
+
+    def game_of(self, user_id):
+        return self.by_user.get(user_id)
+
+    def in_game(self, user_id):
+        return user_id in self.by_user
+
+    def games_in_channel(self, channel_id):
+        return self.by_channel.get(channel_id, set())
+
+    def games_in_guild(self, guild_id):
+        return self.by_guild.get(guild_id, set())
+
+    def __len__(self):
+        return len(self._places)
+
+    def __iter__(self):
+        return iter(list(self._places))
@@ -0,0 +1,212 @@
+# exact equity by enumerating every runout of the board.
+#
+# two reductions keep the enumeration small. a relabelling of suits which
+# leaves every player's hole cards (and the known board and dead cards)
+# unchanged maps each runout to one where everyone makes a hand of the same
+# strength, so only the smallest runout of each orbit is evaluated, weighted by
+# the orbit's size. and where nobody can make a flush, a hand's strength only
+# depends on ranks, so those runouts are evaluated once per rank multiset,
+# weighted by how many runouts have it.
+#
+# runouts are grouped by how many cards of each suit they have: that decides
+# whether anyone could make a flush, and a relabelling permutes the counts. so
+# only groups that could make a flush, with the smallest counts of their
+# orbit, are enumerated card by card; the others are counted, not listed.
+from itertools import combinations_with_replacement, permutations, product
+
+import numpy as np
+
+from poker.batch import BLOCK, RANK_UNIT, hand_masks, evaluate_masks, evaluate_rank_keys, rank_keys
+from poker.cards import NUM_RANKS, NUM_SUITS, binomial
+from poker.equity import EquityResult, BOARD_SIZE, outcomes
+
+FLUSH_SIZE = 5
+# RANK_BINOMIALS[n, k] is C(n, k) for the few cards there are of one rank
+RANK_BINOMIALS = np.array([[binomial(n, k) for k in range(NUM_SUITS + 1)] for n in range(NUM_SUITS + 1)],
+                          dtype=np.int64)
+
+
+# every k-combination of range(n) as a (C(n, k), k) array, in lexicographic order
+def combinations_array(n, k):
+    combos = np.zeros((1, 0), dtype=np.int8)
+
+    for depth in range(k):
+        starts = combos[:, -1].astype(np.int64) + 1 if depth else np.zeros(1, dtype=np.int64)
+        # the value at this position must leave room for the ones after it
+        counts = np.maximum(n - k + depth + 1 - starts, 0)
+        rows = np.repeat(np.arange(len(combos)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        combos = np.hstack([combos[rows], (starts[rows] + offsets).astype(np.int8)[:, None]])
+
+    return combos
+
+
+def _relabel(card_id, perm):
+    return perm[card_id // NUM_RANKS] * NUM_RANKS + card_id % NUM_RANKS
+
+
+# suit permutations (as tuples, identity first) that map each group of cards to itself
+def suit_symmetries(groups):
+    groups = [set(group) for group in groups]
+    return [perm for perm in permutations(range(NUM_SUITS))
+            if all({_relabel(i, perm) for i in group} == group for group in groups)]
+
+
+def relabel_masks(masks, perm):
+    # a card's id is suit * 13 + rank, so relabelling suits moves 13-bit blocks
+    result = np.zeros_like(masks)
+    for suit, target in enumerate(perm):
+        block = (masks >> np.uint64(suit * NUM_RANKS)) & BLOCK
+        result |= block << np.uint64(target * NUM_RANKS)
+    return result
+
+
+# suit counts of the runouts with each suit's count at most its size
+def _suit_counts(needed, sizes):
+    for counts in product(*(range(min(size, needed) + 1) for size in sizes)):
+        if sum(counts) == needed:
+            yield counts
+
+
+def _permute(counts, perm):
+    result = [0] * NUM_SUITS
+    for suit, target in enumerate(perm):
+        result[target] = counts[suit]
+    return tuple(result)
+
+
+# masks of every runout taking counts[suit] of the cards in available[suit]
+def _runouts_with(available, counts):
+    masks = np.zeros(1, dtype=np.uint64)
+    for cards, count in zip(available, counts):
+        ids = np.array(cards, dtype=np.int8)[combinations_array(len(cards), count)]
+        masks = (masks[:, None] | hand_masks(ids)[None, :]).ravel()
+    return masks
+
+
+class Runouts:
+    def __init__(self, hands, board=(), dead=()):
+        self.hole = [[c.id for c in hand] for hand in hands]
+        self.board = [c.id for c in board]
+        dead = [c.id for c in dead]
+
+        known = [i for cards in self.hole for i in cards] + self.board + dead
+        assert len(set(known)) == len(known), "a card can't be in two places at once"
+        assert len(self.board) <= BOARD_SIZE, "can't have more than 5 cards on the table"
+
+        self._known = known = set(known)
+        needed = BOARD_SIZE - len(self.board)
+        available = [[i for i in range(suit * NUM_RANKS, (suit + 1) * NUM_RANKS) if i not in known]
+                     for suit in range(NUM_SUITS)]
+        self.symmetries = suit_symmetries(self.hole + [self.board, dead])
+
+        # the most cards of each suit any player has between their hand and the board
+        board_suits = np.bincount(np.array(self.board, dtype=np.intp) // NUM_RANKS, minlength=NUM_SUITS)
+        held = board_suits + np.max([np.bincount(np.array(cards, dtype=np.intp) // NUM_RANKS, minlength=NUM_SUITS)
+                                     for cards in self.hole], axis=0)
+
+        # runouts that could make a flush, one per orbit. a runout with the
+        # smallest counts is its orbit's representative if it's the smallest
+        # relabelling by the symmetries that keep those counts; fixed is how
+        # many symmetries map it to itself
+        flush_masks = []
+        fixed = []
+        for counts in _suit_counts(needed, [len(cards) for cards in available]):
+            if not any(h + n >= FLUSH_SIZE for h, n in zip(held, counts)):
+                continue
+            images = [_permute(counts, perm) for perm in self.symmetries]
+            if min(images) != counts:
+                continue
+
+            masks = _runouts_with(available, counts)
+            keys = masks
+            fix = np.ones(len(masks), dtype=np.int64)
+            for perm, image in zip(self.symmetries[1:], images[1:]):
+                if image == counts:
+                    relabelled = relabel_masks(masks, perm)
+                    keys = np.minimum(keys, relabelled)
+                    fix += relabelled == masks
+            is_rep = keys == masks
+            flush_masks.append(masks[is_rep])
+            fixed.append(fix[is_rep])
+        self._flush_masks = np.concatenate(flush_masks) if flush_masks else np.zeros(0, dtype=np.uint64)
+        self._fixed = np.concatenate(fixed) if fixed else np.zeros(0, dtype=np.int64)
+
+        # every multiset of ranks the runout could have, as counts per rank
+        self._rank_available = np.bincount([i % NUM_RANKS for cards in available for i in cards],
+                                           minlength=NUM_RANKS)
+        multisets = list(combinations_with_replacement(range(NUM_RANKS), needed))
+        multisets = np.array(multisets, dtype=np.intp).reshape(len(multisets), needed)
+        rank_counts = np.zeros((len(multisets), NUM_RANKS), dtype=np.intp)
+        for column in range(needed):
+            np.add.at(rank_counts, (np.arange(len(multisets)), multisets[:, column]), 1)
+        rank_counts = rank_counts[(rank_counts <= self._rank_available).all(axis=1)]
+        keys = rank_counts @ RANK_UNIT
+        order = np.argsort(keys)
+        self._rank_counts = rank_counts[order]
+        self._rank_keys = keys[order]
+        # the rank multiset of each flush runout, whose count it comes out of
+        self._flush_ranks = np.searchsorted(self._rank_keys, rank_keys(self._flush_masks))
+
+        board_mask = sum(1 << i for i in self.board)
+        board_key = int(RANK_UNIT[[i % NUM_RANKS for i in self.board]].sum())
+        self._flush_strengths = np.empty((len(self.hole), len(self._flush_masks)), dtype=np.int32)
+        self._rank_strengths = np.empty((len(self.hole), len(self._rank_keys)), dtype=np.int32)
+        for i, cards in enumerate(self.hole):
+            hole_mask = np.uint64(board_mask | sum(1 << c for c in cards))
+            self._flush_strengths[i] = evaluate_masks(self._flush_masks | hole_mask)
+            hole_key = board_key + int(RANK_UNIT[[c % NUM_RANKS for c in cards]].sum())
+            self._rank_strengths[i] = evaluate_rank_keys(self._rank_keys + hole_key)
+
+        self._revealed = []
+        self._weigh()
+
+    @property
+    def num_classes(self):
+        return len(self._flush_masks) + len(self._rank_keys)
+
+    # how many runouts (containing every card revealed so far) each flush
+    # representative and rank multiset stands for; sets the result
+    def _weigh(self):
+        revealed = np.uint64(sum(1 << i for i in self._revealed))
+        images = np.zeros(len(self._flush_masks), dtype=np.int64)
+        for perm in self.symmetries:
+            images += (relabel_masks(self._flush_masks, perm) & revealed) == revealed
+        flush_weights = images // self._fixed
+
+        # runouts with each multiset: the revealed cards, and the rest of each
+        # rank from what's left of it. less the ones that could make a flush
+        taken = np.bincount([i % NUM_RANKS for i in self._revealed], minlength=NUM_RANKS)
+        rest = self._rank_counts - taken
+        ways = np.where(rest >= 0, RANK_BINOMIALS[self._rank_available - taken, np.maximum(rest, 0)], 0)
+        rank_weights = ways.prod(axis=1) - np.bincount(self._flush_ranks, flush_weights,
+                                                       minlength=len(self._rank_keys)).astype(np.int64)
+
+        # representatives that no runout left contains can't come back
+        keep = flush_weights > 0
+        self._flush_masks = self._flush_masks[keep]
+        self._fixed = self._fixed[keep]
+        self._flush_ranks = self._flush_ranks[keep]
+        self._flush_strengths = self._flush_strengths[:, keep]
+
+        weights = np.concatenate([flush_weights[keep], rank_weights])
+        self.num_runouts = int(weights.sum())
+        wins, ties, shares = outcomes(np.hstack([self._flush_strengths, self._rank_strengths]), weights)
+        self.result = EquityResult(wins.tolist(), ties.tolist(), shares.tolist(), self.num_runouts, exact=True)
+
+    # narrows the enumeration to runouts containing newly revealed board cards
+    # (e.g. after Game.flip), reusing the strengths already computed
+    def reveal(self, cards):
+        cards = [c.id for c in cards]
+        assert not set(cards) & self._known, "those cards are already in play"
+
+        self._revealed += cards
+        self.board += cards
+        self._known.update(cards)
+
+        self._weigh()
+        return self.result
+
+
+def exact_equity(hands, board=(), dead=()):
+    return Runouts(hands, board, dead).result
@@ -0,0 +1,88 @@
+# strategies for simulated players. a strategy is any callable taking the
+# HandState it has to act in (the acting seat is state.turn) and a random.Random,
+# and returning (action, raise_to), where raise_to only matters for a raise.
+# tournament.py seats these against each other; it can also load a strategy
+# from any module as "module:function".
+import importlib
+
+from poker.engine import CHECK, CALL, RAISE, FOLD, PREFLOP
+from poker.hands import PokerHand, strength_category
+from poker.preflop import get_preflop_table, MAX_OPPONENTS
+
+
+def _check_or_call(state):
+    return (CHECK if CHECK in state.legal_actions() else CALL), 0
+
+
+def _raise_or_call(state, raise_to):
+    if RAISE not in state.legal_actions():
+        return _check_or_call(state)
+    return RAISE, max(state.min_raise_to(), min(raise_to, state.max_raise_to()))
+
+
+def _check_or_fold(state):
+    return (CHECK, 0) if CHECK in state.legal_actions() else (FOLD, 0)
+
+
+def calling_station(state, rng):
+    return _check_or_call(state)
+
+
+def random_player(state, rng):
+    action = rng.choice(state.legal_actions())
+    if action == RAISE:
+        return RAISE, rng.randint(state.min_raise_to(), state.max_raise_to())
+    return action, 0
+
+
+def maniac(state, rng):
+    return _raise_or_call(state, state.current_bet + state.pot)
+
+
+def _preflop_equity(state, seat):
+    table = get_preflop_table()
+    if table is None:
+        return 0.5
+    opponents = min(sum(1 for folded in state.folded if not folded) - 1, MAX_OPPONENTS)
+    return table.equity(state.hole[seat], max(opponents, 1))
+
+
+# plays few hands preflop and bets made hands afterwards
+def tight_aggressive(state, rng):
+    seat = state.turn
+    if state.street == PREFLOP:
+        hand_equity = _preflop_equity(state, seat)
+        fair_share = 1 / (len(state.folded) - sum(state.folded))
+        # how far above an even share of the pot this hand is expected to win
+        edge = (hand_equity - fair_share) / (1 - fair_share)
+        if edge > 0.25:
+            return _raise_or_call(state, state.current_bet + state.pot)
+        if edge > 0.1 or state.to_call() == 0:
+            return _check_or_call(state)
+        return FOLD, 0
+
+    category = strength_category(state.hand_strength(seat)).value
+    if category >= PokerHand.TWO_PAIR.value:
+        return _raise_or_call(state, state.current_bet + state.pot)
+    if category == PokerHand.PAIR.value and state.to_call() <= state.pot // 2:
+        return _check_or_call(state)
+    return _check_or_fold(state)
+
+
+STRATEGIES = {
+    "calling_station": calling_station,
+    "random": random_player,
+    "maniac": maniac,
+    "tight_aggressive": tight_aggressive,
+}
+
+
+# a strategy by name, or by "module:function" for one defined elsewhere
+def get_strategy(name):
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    if ":" not in name:
+        raise ValueError(f"unknown strategy {name!r}; choose from {', '.join(STRATEGIES)} or use module:function")
+
+    module, function = name.split(":", 1)
+    return getattr(importlib.import_module(module), function)
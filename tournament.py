@@ -0,0 +1,267 @@
+# plays strategies from poker/strategies.py against each other over many
+# tables, to compare them and to tune starting stacks and blinds offline.
+#
+#   python tournament.py --strategies tight_aggressive maniac random --tables 20000
+#   python tournament.py --strategies tight_aggressive mybots:bluffer --seats 2
+#   python tournament.py ... --checkpoint run.json   # resumes run.json if it exists
+#
+# tables are played in tasks of --chunk tables across a process pool. every task
+# gets its own rng seeded from --seed and the task number, so a run gives the
+# same results whatever --workers is, and a resumed run the same as an unbroken
+# one. strategies take turns at each seat from table to table, so no strategy
+# keeps the best position.
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from poker.cards import Deck
+from poker.engine import HandState, SMALL_BLIND, BIG_BLIND
+from poker.strategies import get_strategy
+
+DEFAULT_SEED = 1234
+DEFAULT_TABLES = 1000
+DEFAULT_SEATS = 6
+# the starting balance of a player in Game
+DEFAULT_STACK = 1000
+# a table stops after this many hands even if nobody has all the chips
+DEFAULT_MAX_HANDS = 300
+DEFAULT_CHUNK = 20
+# seconds between checkpoint writes
+DEFAULT_CHECKPOINT_EVERY = 30
+Z_95 = 1.96
+
+
+def task_rng(seed, task):
+    return random.Random(f"{seed}/{task}")
+
+
+# plays hands at one table until one player has every chip or max_hands is
+# reached. returns the final stacks, how many hands each seat was dealt and
+# how many hands were played
+def play_table(strategies, stack, small_blind, big_blind, max_hands, rng):
+    num_seats = len(strategies)
+    stacks = [stack] * num_seats
+    dealt = [0] * num_seats
+    dealer = 0
+    # one deck for the table, reshuffled every hand
+    deck = Deck(rng)
+
+    hands = 0
+    while hands < max_hands:
+        alive = [seat for seat in range(num_seats) if stacks[seat] > 0]
+        if len(alive) < 2:
+            break
+
+        deck.shuffle()
+        # the engine wants the dealer in seat 0
+        start = next((i for i, seat in enumerate(alive) if seat >= dealer), 0)
+        order = alive[start:] + alive[:start]
+
+        state = HandState([stacks[seat] for seat in order], deck,
+                          small_blind=small_blind, big_blind=big_blind)
+        while not state.finished:
+            action, raise_to = strategies[order[state.turn]](state, rng)
+            state.act(action, raise_to)
+
+        for i, seat in enumerate(order):
+            stacks[seat] = state.stacks[i]
+            dealt[seat] += 1
+        dealer = (order[0] + 1) % num_seats
+        hands += 1
+
+    return stacks, dealt, hands
+
+
+class Totals:
+    FIELDS = ("seats", "net", "net_sq", "hands", "wins")
+
+    def __init__(self):
+        # strategy name -> [seat results, net big blinds, sum of squared net
+        # big blinds, hands dealt, tables won]
+        self.by_strategy = {}
+        self.tables = 0
+        self.hands = 0
+
+    def add_table(self, names, stacks, dealt, stack, big_blind, hands):
+        best = max(stacks)
+        winners = sum(1 for s in stacks if s == best)
+        for name, final, seat_hands in zip(names, stacks, dealt):
+            totals = self.by_strategy.setdefault(name, [0] * len(self.FIELDS))
+            net = (final - stack) / big_blind
+            totals[0] += 1
+            totals[1] += net
+            totals[2] += net * net
+            totals[3] += seat_hands
+            totals[4] += 1 / winners if final == best else 0
+        self.tables += 1
+        self.hands += hands
+
+    def merge(self, other):
+        for name, values in other.by_strategy.items():
+            totals = self.by_strategy.setdefault(name, [0] * len(self.FIELDS))
+            for i, value in enumerate(values):
+                totals[i] += value
+        self.tables += other.tables
+        self.hands += other.hands
+
+    def to_dict(self):
+        return {"tables": self.tables, "hands": self.hands,
+                "by_strategy": {name: dict(zip(self.FIELDS, values)) for name, values in self.by_strategy.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        totals = cls()
+        totals.tables = data["tables"]
+        totals.hands = data["hands"]
+        totals.by_strategy = {name: [values[field] for field in cls.FIELDS]
+                              for name, values in data["by_strategy"].items()}
+        return totals
+
+    # per strategy: net big blinds per table and the share of tables won,
+    # each with a 95% confidence interval, and big blinds won per 100 hands
+    def summary(self, z=Z_95):
+        rows = {}
+        for name, (seats, net, net_sq, hands, wins) in self.by_strategy.items():
+            mean = net / seats
+            variance = max(net_sq / seats - mean * mean, 0) * seats / (seats - 1) if seats > 1 else 0
+            win_rate = wins / seats
+            rows[name] = {
+                "seats": seats,
+                "bb_per_table": mean,
+                "bb_per_table_ci": z * math.sqrt(variance / seats),
+                "bb_per_100": 100 * net / hands if hands else 0.0,
+                "win_rate": win_rate,
+                "win_rate_ci": z * math.sqrt(win_rate * (1 - win_rate) / seats),
+            }
+        return rows
+
+
+def run_task(config, task):
+    rng = task_rng(config["seed"], task)
+    strategies = config["strategies"]
+    funcs = {name: get_strategy(name) for name in strategies}
+    totals = Totals()
+
+    first = task * config["chunk"]
+    for table in range(first, min(first + config["chunk"], config["tables"])):
+        names = [strategies[(table + seat) % len(strategies)] for seat in range(config["seats"])]
+        stacks, dealt, hands = play_table([funcs[name] for name in names], config["stack"],
+                                          config["small_blind"], config["big_blind"], config["max_hands"], rng)
+        totals.add_table(names, stacks, dealt, config["stack"], config["big_blind"], hands)
+    return totals
+
+
+def load_checkpoint(path, config):
+    if not path or not os.path.exists(path):
+        return set(), Totals(), 0.0
+
+    with open(path) as f:
+        data = json.load(f)
+    if data["config"] != config:
+        raise SystemExit(f"{path} is a checkpoint of a different run; remove it or change --checkpoint")
+    return set(data["done"]), Totals.from_dict(data["totals"]), data["elapsed"]
+
+
+def save_checkpoint(path, config, done, totals, elapsed):
+    # written to a temporary file first so an interrupted write can't lose the old checkpoint
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump({"config": config, "done": sorted(done), "totals": totals.to_dict(), "elapsed": elapsed}, f)
+    os.replace(temp, path)
+
+
+def print_report(totals, hands_per_sec):
+    print(f"{totals.tables:,} tables, {totals.hands:,} hands, {hands_per_sec:,.0f} hands/s")
+    rows = sorted(totals.summary().items(), key=lambda item: -item[1]["bb_per_table"])
+    for name, r in rows:
+        print(f"{name:<24} {r['bb_per_table']:>+9.2f} ± {r['bb_per_table_ci']:<7.2f} bb/table  "
+              f"{r['bb_per_100']:>+8.2f} bb/100  "
+              f"wins {r['win_rate']:>6.1%} ± {r['win_rate_ci']:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play bot strategies against each other.")
+    parser.add_argument("--strategies", nargs="+", required=True,
+                        help="strategy names from poker/strategies.py, or module:function")
+    parser.add_argument("--tables", type=int, default=DEFAULT_TABLES)
+    parser.add_argument("--seats", type=int, default=DEFAULT_SEATS, help="players per table")
+    parser.add_argument("--stack", type=int, default=DEFAULT_STACK, help="starting chips per player")
+    parser.add_argument("--small-blind", type=int, default=SMALL_BLIND)
+    parser.add_argument("--big-blind", type=int, default=BIG_BLIND)
+    parser.add_argument("--max-hands", type=int, default=DEFAULT_MAX_HANDS, help="hands per table at most")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="tables per task")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (0 plays every table in this process)")
+    parser.add_argument("--checkpoint", help="save progress here, and resume from it if it exists")
+    parser.add_argument("--checkpoint-every", type=float, default=DEFAULT_CHECKPOINT_EVERY, help="seconds")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    if args.seats < 2:
+        parser.error("a table needs at least two seats")
+    for name in args.strategies:
+        try:
+            get_strategy(name)
+        except (ValueError, ImportError, AttributeError) as e:
+            parser.error(str(e))
+
+    # everything that changes the results; a checkpoint only resumes the same run
+    config = {"strategies": args.strategies, "tables": args.tables, "seats": args.seats, "stack": args.stack,
+              "small_blind": args.small_blind, "big_blind": args.big_blind, "max_hands": args.max_hands,
+              "seed": args.seed, "chunk": args.chunk}
+    done, totals, elapsed = load_checkpoint(args.checkpoint, config)
+    if done:
+        print(f"resuming: {totals.tables:,} of {args.tables:,} tables already played")
+
+    num_tasks = math.ceil(args.tables / args.chunk)
+    pending = [task for task in range(num_tasks) if task not in done]
+
+    start = time.perf_counter()
+    start_hands = totals.hands
+    last_save = start
+
+    def finished(task, partial):
+        nonlocal last_save
+        totals.merge(partial)
+        done.add(task)
+        now = time.perf_counter()
+        if args.checkpoint and now - last_save >= args.checkpoint_every:
+            save_checkpoint(args.checkpoint, config, done, totals, elapsed + now - start)
+            last_save = now
+
+    try:
+        if args.workers == 0:
+            for task in pending:
+                finished(task, run_task(config, task))
+        else:
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                futures = {pool.submit(run_task, config, task): task for task in pending}
+                for future in as_completed(futures):
+                    finished(futures[future], future.result())
+    except KeyboardInterrupt:
+        if args.checkpoint:
+            save_checkpoint(args.checkpoint, config, done, totals, elapsed + time.perf_counter() - start)
+            print(f"interrupted; progress saved to {args.checkpoint}")
+        sys.exit(1)
+
+    session = time.perf_counter() - start
+    if args.checkpoint:
+        save_checkpoint(args.checkpoint, config, done, totals, elapsed + session)
+
+    hands_per_sec = (totals.hands - start_hands) / session if session else 0.0
+    print_report(totals, hands_per_sec)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": config, "hands_per_sec": hands_per_sec, **totals.to_dict(),
+                       "summary": totals.summary()}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()